@@ -1,9 +1,25 @@
-from chalice import Chalice, BadRequestError
+from chalice import Chalice, BadRequestError, WebsocketDisconnectedError
 import boto3
 import os
+import shutil
 import sqlite3
 import json
+import logging
+import threading
+import time
 import numpy as np
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from collections import namedtuple
+
+from chalicelib import artifact, binary, cache, lexical, vector_store
+from chalicelib.cache import SemanticCache, TieredCache, make_key, normalize_text
+from chalicelib.segments import Delta, SegmentedIndex
+from chalicelib.sessions import SessionStore
+from chalicelib.shards import ShardCache, ShardedIndex, is_sharded
+from chalicelib.vector_index import VectorIndex
 
 # Configuration
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
@@ -14,58 +30,483 @@ TOP_P = float(os.environ.get('TOP_P', '1'))
 MAX_TOKENS = int(os.environ.get('MAX_TOKENS', '2048'))
 LATENCY = os.environ.get('LATENCY', 'standard')
 NUM_RETRIEVAL_RESULTS = int(os.environ.get('NUM_RETRIEVAL_RESULTS', '5'))
+EMBEDDING_MODEL_ID = 'amazon.titan-embed-text-v2:0'
+# Must match the dimensions the vector store was built with (256, 512 or 1024)
+EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', '1024'))
+# exact: score every chunk; ivf: probe the IVF_NPROBE closest k-means lists;
+# hnsw: walk the HNSW graph keeping HNSW_EF_SEARCH candidates; binary: Hamming
+# prefilter to BINARY_CANDIDATES chunks, then rerank by cosine similarity
+SEARCH_MODE = os.environ.get('SEARCH_MODE', 'exact')
+IVF_NLIST = int(os.environ.get('IVF_NLIST', '0'))
+IVF_NPROBE = int(os.environ.get('IVF_NPROBE', '8'))
+HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', '64'))
+BINARY_CANDIDATES = int(os.environ.get('BINARY_CANDIDATES', '200'))
+# Shortlist reranked at full precision when the store is quantized
+RESCORE_CANDIDATES = int(os.environ.get('RESCORE_CANDIDATES', '50'))
+# vector: embedding search only; hybrid: fuse BM25 and vector rankings with RRF,
+# answering short keyword queries lexically without calling Titan; lexical: BM25 only
+RETRIEVAL_MODE = os.environ.get('RETRIEVAL_MODE', 'hybrid')
+LEXICAL_CANDIDATES = int(os.environ.get('LEXICAL_CANDIDATES', '20'))
+LEXICAL_ONLY_MAX_TERMS = int(os.environ.get('LEXICAL_ONLY_MAX_TERMS', '3'))
+RRF_K = int(os.environ.get('RRF_K', '60'))
+# Shared tier behind the in-process embedding and response caches:
+# dynamodb (CACHE_TABLE, shared by all containers), sqlite (a file in /tmp
+# holding up to CACHE_DISK_SIZE entries), memory, or none
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')
+CACHE_TABLE = os.environ.get('CACHE_TABLE', 'bedrock-chat-cache')
+CACHE_DISK_SIZE = int(os.environ.get('CACHE_DISK_SIZE', '4096'))
+CACHE_SQLITE_PATH = "/tmp/cache.db"
+# Query embeddings kept in memory, and how long they stay in the shared tier
+# (Titan's output for a text does not change, but the table must not grow
+# without bound)
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '256'))
+EMBEDDING_CACHE_TTL = int(os.environ.get('EMBEDDING_CACHE_TTL', '86400'))
+# Answers reused for repeated questions until the store changes or they expire
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+# Answers reused for paraphrased questions whose embeddings are at least
+# SEMANTIC_CACHE_THRESHOLD cosine-similar to a cached question
+SEMANTIC_CACHE_SIZE = int(os.environ.get('SEMANTIC_CACHE_SIZE', '256'))
+SEMANTIC_CACHE_TTL = int(os.environ.get('SEMANTIC_CACHE_TTL', '3600'))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+# Multi-turn sessions: stored like the shared cache tier (dynamodb, sqlite,
+# memory, or none to disable them) and dropped SESSION_TTL seconds after
+# their last turn. Earlier turns go into the prompt up to
+# SESSION_HISTORY_TOKENS (estimated at four characters per token), and a
+# follow-up at least SESSION_TOPIC_THRESHOLD cosine-similar to the question
+# that last ran retrieval reuses its context
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+SESSION_TABLE = os.environ.get('SESSION_TABLE', CACHE_TABLE)
+SESSION_SQLITE_PATH = "/tmp/sessions.db"
+SESSION_TTL = int(os.environ.get('SESSION_TTL', '86400'))
+SESSION_HISTORY_TOKENS = int(os.environ.get('SESSION_HISTORY_TOKENS', '2000'))
+SESSION_TOPIC_THRESHOLD = float(os.environ.get('SESSION_TOPIC_THRESHOLD', '0.6'))
 S3_BUCKET = os.environ.get('S3_BUCKET', 'vector-bucket-eliot-pitman')
-DB_LOCAL_PATH = "/tmp/vector_store.db"
+# Seconds a container serves its store before asking S3 (by ETag) for a newer
+# one; if S3 does not answer within STORE_CHECK_TIMEOUT the old store is kept
+STORE_CHECK_INTERVAL = float(os.environ.get('STORE_CHECK_INTERVAL', '60'))
+STORE_CHECK_TIMEOUT = float(os.environ.get('STORE_CHECK_TIMEOUT', '2'))
+# Store files larger than one part are fetched with this many concurrent
+# ranged GETs; 0 bandwidth means unlimited
+DOWNLOAD_PART_SIZE_MB = int(os.environ.get('DOWNLOAD_PART_SIZE_MB', '16'))
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DOWNLOAD_CONCURRENCY', '8'))
+DOWNLOAD_MAX_BANDWIDTH_MB = float(os.environ.get('DOWNLOAD_MAX_BANDWIDTH_MB', '0'))
+# Sharded stores: shards routed to per query, and the budgets under which
+# fetched shards stay in /tmp and loaded shards in memory (a fraction of the
+# Lambda's configured memory), each evicting the least recently used
+SHARD_NPROBE = int(os.environ.get('SHARD_NPROBE', '2'))
+SHARD_DISK_MB = int(os.environ.get('SHARD_DISK_MB', '384'))
+SHARD_MEMORY_FRACTION = float(os.environ.get('SHARD_MEMORY_FRACTION', '0.5'))
+LAMBDA_MEMORY_MB = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '1024'))
+# Seconds between checks, while a WebSocket answer streams, for a cancel
+# message or disconnect recorded by another invocation in the shared cache
+WS_CANCEL_CHECK_INTERVAL = float(os.environ.get('WS_CANCEL_CHECK_INTERVAL', '0.5'))
+# Chalice logs only errors unless the app runs in debug mode, which would
+# hide the cache hit rates, download timings and refresh failures logged at
+# INFO and WARNING
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+# No Lambda runs longer than this, so neither does a cancellation flag
+CANCEL_FLAG_TTL = 900
+# Each downloaded base gets a directory named by its checksum, so a new
+# version never replaces files a request may still be opening
+STORES_DIR = "/tmp/stores"
+SEGMENTS_DIR = "/tmp/segments"
+SHARDS_DIR = "/tmp/shards"
+# The manifest and ETag of the store in /tmp, so a re-initialized runtime in
+# the same container serves it without downloading again
+STATE_PATH = "/tmp/vector_store_state.json"
+# Store shipped in the deployment package (or a layer, e.g. /opt/baseline)
+# and served on cold start until the S3 check completes
+BASELINE_DIR = os.environ.get('BASELINE_DIR', os.path.join(os.path.dirname(__file__), 'chalicelib', 'baseline'))
+BASELINE_DB_PATH = os.path.join(BASELINE_DIR, 'vector_store.db')
+BASELINE_VERSION_PATH = os.path.join(BASELINE_DIR, 'VERSION')
+BASELINE_MANIFEST_PATH = os.path.join(BASELINE_DIR, artifact.MANIFEST_KEY)
+
+STORE_CHECK_CONFIG = Config(connect_timeout=STORE_CHECK_TIMEOUT, read_timeout=STORE_CHECK_TIMEOUT,
+                            retries={'max_attempts': 1})
+DOWNLOAD_CONFIG = Config(max_pool_connections=max(10, DOWNLOAD_CONCURRENCY))
+TRANSFER_CONFIG = TransferConfig(
+    multipart_chunksize=DOWNLOAD_PART_SIZE_MB * 1024 * 1024,
+    max_concurrency=DOWNLOAD_CONCURRENCY,
+    max_bandwidth=int(DOWNLOAD_MAX_BANDWIDTH_MB * 1024 * 1024) or None,
+)
 
 app = Chalice(app_name='bedrock-chat-app')
+app.log.setLevel(LOG_LEVEL)
+# chalicelib modules log through the root logger, e.g. L2 cache failures
+logging.getLogger('chalicelib').setLevel(LOG_LEVEL)
+app.experimental_feature_flags.update(['WEBSOCKETS'])
+app.websocket_api.session = boto3.session.Session()
 
 # --- Retrieval helpers ---
 
+# The store being served; when it was last checked against S3
+# (time.monotonic()); and the index built from it. Both are replaced, never
+# mutated, when a refresh switches stores.
+#   path: the base SQLite file
+#   version: S3 ETag of the manifest, covering the base and every delta
+#   base_version: SHA-256 of the base file, so new deltas reuse its index
+#   deltas: local paths of the delta segments, oldest first
+#   shards: manifest entries of a sharded base's shards, by name
+Store = namedtuple('Store', ['path', 'version', 'base_version', 'deltas', 'shards'])
+_store = None
+_store_checked_at = float('-inf')
+_store_lock = threading.Lock()
+_refresh_thread_lock = threading.Lock()
+_index = None
+
+_cache_backend = cache.make_backend(CACHE_BACKEND, CACHE_SQLITE_PATH, CACHE_DISK_SIZE, CACHE_TABLE)
+_embedding_cache = TieredCache('embedding', EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL, backend=_cache_backend,
+                               encode=cache.encode_embedding, decode=cache.decode_embedding)
+_response_cache = TieredCache('response', RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, backend=_cache_backend,
+                              encode=cache.encode_text, decode=cache.decode_text)
+_semantic_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD)
+_session_backend = cache.make_backend(SESSION_BACKEND, SESSION_SQLITE_PATH, CACHE_DISK_SIZE, SESSION_TABLE)
+_sessions = SessionStore(_session_backend, SESSION_TTL) if _session_backend is not None else None
+# Cancel messages and disconnects arrive in other invocations (usually other
+# containers), so they are recorded in the shared tier for the streaming one
+_cancel_flags = TieredCache('cancel', 1024, CANCEL_FLAG_TTL, backend=_cache_backend,
+                            encode=cache.encode_text, decode=cache.decode_text)
+if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ and CACHE_BACKEND != 'dynamodb':
+    app.log.warning(f"CACHE_BACKEND={CACHE_BACKEND} is private to each container, so WebSocket "
+                    f"cancel messages and disconnects will not reach the invocation streaming the answer")
+
+
+def fetch_shard(entry, path):
+    download_file(boto3.client("s3", config=DOWNLOAD_CONFIG), entry, path)
+    vector_store.verify(path)
+
+# Shards are immutable and named by checksum, so one cache serves every
+# store version; shards a new version no longer lists simply age out
+_shard_cache = ShardCache(SHARDS_DIR, fetch_shard, SHARD_DISK_MB * 1024 * 1024,
+                          int(LAMBDA_MEMORY_MB * SHARD_MEMORY_FRACTION * 1024 * 1024))
+
+
 def get_db():
-    s3 = boto3.client("s3")
-    
-    # Check the last modified date of the S3 file
-    meta = s3.head_object(Bucket=S3_BUCKET, Key="vector_store.db")
-    last_modified = str(meta["LastModified"])
-    
-    # Store the timestamp alongside the db
-    timestamp_path = "/tmp/vector_store_timestamp.txt"
-    cached_timestamp = open(timestamp_path).read() if os.path.exists(timestamp_path) else ""
-
-    # Only re-download if the S3 file has changed
-    if last_modified != cached_timestamp or not os.path.exists(DB_LOCAL_PATH):
-        app.log.info("Downloading updated vector store from S3...")
-        s3.download_file(S3_BUCKET, "vector_store.db", DB_LOCAL_PATH)
-        open(timestamp_path, "w").write(last_modified)
-
-    return sqlite3.connect(DB_LOCAL_PATH)
+    """Connect to the current store, refreshing it from S3 when due.
+
+    Once a store is being served (one a previous runtime downloaded to /tmp,
+    or the baseline bundled in the package) refreshes run on a background
+    thread and switch over when done, so requests never wait on S3. Only a
+    container with no store at all blocks on the first download.
+
+    Lambda freezes the container between invocations, and a background
+    thread with it: a refresh only makes progress while some invocation is
+    running, and one whose S3 connections went stale while frozen fails and
+    is retried by the next request.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = local_store()
+    if not store_is_fresh():
+        if _store is None:
+            refresh()
+        elif _refresh_thread_lock.acquire(blocking=False):
+            threading.Thread(target=background_refresh, daemon=True).start()
+    return connect_store(_store)
+
+def local_store():
+    """The store to serve before S3 answers, or None."""
+    if os.path.exists(STATE_PATH):
+        state = json.load(open(STATE_PATH))
+        store = store_from_manifest(state['path'], state['etag'], state['manifest'])
+        if all(os.path.exists(path) for path in (store.path,) + store.deltas):
+            return store
+    if os.path.exists(BASELINE_VERSION_PATH):
+        version = open(BASELINE_VERSION_PATH).read().strip()
+        app.log.info(f"Serving bundled baseline vector store version {version}")
+        if os.path.exists(BASELINE_MANIFEST_PATH):
+            manifest = artifact.read_manifest(open(BASELINE_MANIFEST_PATH).read())
+            return store_from_manifest(BASELINE_DB_PATH, version, manifest)
+        return Store(BASELINE_DB_PATH, version, version, (), {})
+    return None
+
+def store_from_manifest(path, version, manifest):
+    return Store(path, version, manifest['files']['vector_store.db']['sha256'],
+                 tuple(segment_path(entry) for entry in manifest['deltas']), manifest.get('shards', {}))
+
+def base_path(base_version):
+    return os.path.join(STORES_DIR, base_version, "vector_store.db")
+
+def segment_path(entry):
+    # Segments are immutable, so their checksum names them
+    return os.path.join(SEGMENTS_DIR, entry['sha256'] + ".db")
+
+class StoreConnection(sqlite3.Connection):
+    """Connection tagged with the store it reads, which a concurrent
+    refresh may already have moved past."""
+    store = None
+
+    @property
+    def version(self):
+        return self.store.version
+
+def connect_store(store):
+    if store.path == BASELINE_DB_PATH:
+        # The package directory is read-only, and the file never changes
+        conn = sqlite3.connect(f"file:{store.path}?immutable=1", uri=True, factory=StoreConnection)
+    else:
+        conn = sqlite3.connect(store.path, factory=StoreConnection)
+    conn.store = store
+    return conn
+
+def store_is_fresh():
+    return _store is not None and time.monotonic() - _store_checked_at < STORE_CHECK_INTERVAL
+
+def background_refresh():
+    try:
+        refresh()
+    except Exception as e:
+        app.log.error(f"Background vector store refresh failed: {e}")
+    finally:
+        _refresh_thread_lock.release()
+
+def refresh():
+    global _store, _store_checked_at
+    # One refresh at a time; callers queued behind it find the store fresh
+    # and skip their own
+    with _store_lock:
+        if store_is_fresh():
+            return
+        try:
+            _store = refresh_store(_store)
+        except Exception as e:
+            if _store is None:
+                raise
+            # Left unchecked, so the next request tries again rather than
+            # waiting out STORE_CHECK_INTERVAL; every failure is logged with
+            # how stale the store being served may be
+            checked = ("never checked against S3" if _store_checked_at == float('-inf')
+                       else f"last checked {time.monotonic() - _store_checked_at:.0f}s ago")
+            app.log.warning(f"Vector store refresh failed, serving version {_store.version} ({checked}): {e}")
+            return
+        _store_checked_at = time.monotonic()
+
+def refresh_store(current):
+    """Return the store S3's manifest describes, downloading only what the
+    current store lacks: nothing if the manifest's ETag is unchanged, and
+    only new delta segments if the base is.
+
+    Files are decompressed beside their final paths while they download,
+    verified, then moved into place with os.replace, so readers only ever
+    see a complete store. A new base gets a directory of its own under
+    STORES_DIR, so nothing the current store's readers may still open is
+    replaced; superseded files are removed only once a later switch has
+    left them two versions behind.
+    """
+    s3 = boto3.client("s3", config=STORE_CHECK_CONFIG)
+    conditions = {"IfNoneMatch": current.version} if current else {}
+    try:
+        # A conditional GET answers "unchanged" and "here is what changed"
+        # in one small round-trip
+        response = s3.get_object(Bucket=S3_BUCKET, Key=artifact.MANIFEST_KEY, **conditions)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+            return current
+        raise
+    manifest = artifact.read_manifest(response["Body"].read())
+    store = store_from_manifest(None, response["ETag"], manifest)
+
+    # The check client gives up fast; downloads get a pool sized for
+    # parallel parts and the default retries
+    s3 = boto3.client("s3", config=DOWNLOAD_CONFIG)
+    if current is not None and current.base_version == store.base_version:
+        store = store._replace(path=current.path)
+    else:
+        store = store._replace(path=base_path(store.base_version))
+        app.log.info(f"Downloading vector store version {store.version} from S3...")
+        download_base(s3, manifest['files'], os.path.dirname(store.path))
+    download_segments(s3, manifest['deltas'])
+
+    state_path = STATE_PATH + ".download"
+    with open(state_path, "w") as f:
+        json.dump({'path': store.path, 'etag': store.version, 'manifest': manifest}, f)
+    os.replace(state_path, STATE_PATH)
+
+    # Bases and segments still in use by the current index stay until the
+    # next switch
+    keep = {os.path.dirname(store.path), os.path.dirname(current.path) if current else None}
+    os.makedirs(STORES_DIR, exist_ok=True)
+    for name in os.listdir(STORES_DIR):
+        if os.path.join(STORES_DIR, name) not in keep:
+            shutil.rmtree(os.path.join(STORES_DIR, name), ignore_errors=True)
+    keep = set(store.deltas) | set(current.deltas if current else ())
+    for name in os.listdir(SEGMENTS_DIR):
+        if os.path.join(SEGMENTS_DIR, name) not in keep:
+            os.remove(os.path.join(SEGMENTS_DIR, name))
+    return store
+
+def download_file(s3, entry, path):
+    start = time.perf_counter()
+    parts = artifact.download(s3, S3_BUCKET, entry, path, TRANSFER_CONFIG)
+    for offset, size, seconds in parts:
+        app.log.info(f"  {entry['key']} part at {offset}: {size / 1e6:.1f} MB in {seconds:.2f}s "
+                     f"({size / 1e6 / seconds:.1f} MB/s)")
+    elapsed = time.perf_counter() - start
+    app.log.info(f"Fetched {entry['key']} in {elapsed:.2f}s "
+                 f"({len(parts) or 1} part(s), {entry['size'] / 1e6:.1f} MB decompressed)")
+
+def download_base(s3, files, store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    downloads = {name: os.path.join(store_dir, name) + ".download" for name in files}
+    try:
+        for name, entry in files.items():
+            download_file(s3, entry, downloads[name])
+        meta = vector_store.verify(downloads["vector_store.db"])
+        if meta.get('vector_layout') == 'npy':
+            vector_store.check_sidecar(downloads[meta['vector_file']], int(meta['vector_count']),
+                                       vector_store.embedding_dtype(meta))
+        # The db goes last: it is what marks the new version live
+        for name in sorted(files, key=lambda name: name == "vector_store.db"):
+            os.replace(downloads[name], os.path.join(store_dir, name))
+    finally:
+        for path in downloads.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+def download_segments(s3, deltas):
+    os.makedirs(SEGMENTS_DIR, exist_ok=True)
+    missing = [entry for entry in deltas if not os.path.exists(segment_path(entry))]
+    if missing:
+        app.log.info(f"Downloading {len(missing)} of {len(deltas)} delta segments from S3...")
+    for entry in missing:
+        path = segment_path(entry)
+        try:
+            download_file(s3, entry, path + ".download")
+            vector_store.verify(path + ".download")
+            os.replace(path + ".download", path)
+        finally:
+            if os.path.exists(path + ".download"):
+                os.remove(path + ".download")
+
+def get_index(conn):
+    global _index
+    store = conn.store
+    index = _index
+    if index is None or index.version != store.version:
+        # A manifest that only adds deltas keeps the base index
+        base = index.base if index is not None else None
+        if base is None or base.version != store.base_version:
+            if is_sharded(vector_store.read_meta(conn)):
+                # Only the routing store is loaded here; shards load on first use
+                base = ShardedIndex.load(conn, store.base_version, store.shards, _shard_cache, SHARD_NPROBE)
+            else:
+                base = VectorIndex.load(conn, store.base_version,
+                                        ivf_nlist=IVF_NLIST if SEARCH_MODE == 'ivf' else 0,
+                                        search_mode=SEARCH_MODE)
+            vector_store.check_compatible(base.meta, base.dimensions, EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS)
+            app.log.info(f"Loaded vector index with {len(base)} chunks (version {store.base_version})")
+        deltas = [Delta.load(path) for path in store.deltas]
+        for delta in deltas:
+            vector_store.check_compatible(delta.meta, base.dimensions, EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS)
+        index = SegmentedIndex(store.version, base, deltas)
+        if deltas:
+            app.log.info(f"Applied {len(deltas)} delta segments: {len(index.ids)} chunks added, "
+                         f"{len(index.deleted_ids)} deleted (version {store.version})")
+        _index = index
+    return index
 
 def embed_text(text):
+    """Return (vector, packed bits); bits are only requested in binary mode."""
+    with_bits = SEARCH_MODE == 'binary'
+    key = make_key(EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS, with_bits, normalize_text(text))
+    cached = _embedding_cache.get(key)
+    app.log.info(f"Embedding cache {'hit' if cached is not None else 'miss'} ({_embedding_cache.describe()})")
+    if cached is not None:
+        return cached
+
+    vector, bits = invoke_embedding_model(text, with_bits)
+    _embedding_cache.put(key, (vector, bits))
+    return vector, bits
+
+def invoke_embedding_model(text, with_bits):
+    request = {"inputText": text, "dimensions": EMBEDDING_DIMENSIONS, "normalize": True}
+    if with_bits:
+        request["embeddingTypes"] = ["float", "binary"]
+
     bedrock = boto3.client("bedrock-runtime", region_name=AWS_REGION)
     response = bedrock.invoke_model(
-        modelId="amazon.titan-embed-text-v2:0",
-        body=json.dumps({"inputText": text})
+        modelId=EMBEDDING_MODEL_ID,
+        # Titan returns a unit vector, so scoring against the normalized
+        # index needs no norm on the query side.
+        body=json.dumps(request)
     )
-    return np.array(json.loads(response["body"].read())["embedding"])
+    result = json.loads(response["body"].read())
+    if with_bits:
+        by_type = result["embeddingsByType"]
+        return np.array(by_type["float"], dtype=np.float32), binary.pack(by_type["binary"])
+    return np.array(result["embedding"], dtype=np.float32), None
 
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def response_cache_key(message, store_version):
+    # Answers outlive a deploy in the shared tier, so everything that shapes
+    # them is in the key: the prompt, model settings, retrieval and store
+    return make_key(
+        normalize_text(message), SYSTEM_PROMPT, MODEL_ID, TEMPERATURE, TOP_P, MAX_TOKENS, LATENCY,
+        NUM_RETRIEVAL_RESULTS, RETRIEVAL_MODE, SEARCH_MODE, store_version
+    )
 
-def retrieve(query, top_k=NUM_RETRIEVAL_RESULTS):
-    conn = get_db()
-    rows = conn.execute("SELECT source, chunk_text, embedding FROM embeddings").fetchall()
-    conn.close()
-    query_vec = embed_text(query)
-    scored = sorted(
-        [(cosine_similarity(query_vec, np.array(json.loads(emb))), src, txt)
-         for src, txt, emb in rows],
-        reverse=True
+def lexical_search(conn, index, query):
+    if RETRIEVAL_MODE == 'vector' or not lexical.available(index.meta):
+        return []
+    try:
+        return index.lexical_search(conn, query, LEXICAL_CANDIDATES)
+    except sqlite3.OperationalError as e:
+        # e.g. a Python runtime whose SQLite lacks FTS5
+        app.log.warning(f"Lexical search unavailable, using vector search only: {e}")
+        return []
+
+def vector_search(conn, index, query, top_k):
+    query_vec, query_bits = embed_text(query)
+    chunk_ids, scores = index.search(
+        query_vec, top_k, mode=SEARCH_MODE, nprobe=IVF_NPROBE, ef_search=HNSW_EF_SEARCH,
+        conn=conn, rescore=RESCORE_CANDIDATES,
+        query_bits=query_bits, binary_candidates=BINARY_CANDIDATES
     )
-    return scored[:top_k]
+    if isinstance(index.base, ShardedIndex):
+        app.log.info(f"Shard cache: {_shard_cache.describe()}")
+    return list(zip(chunk_ids.tolist(), scores.tolist()))
 
+def keyword_only(meta, query):
+    """Whether retrieve() answers the query from BM25 alone, without
+    embedding it, whenever BM25 finds anything."""
+    if RETRIEVAL_MODE == 'vector' or not lexical.available(meta):
+        return False
+    return RETRIEVAL_MODE == 'lexical' or lexical.is_keyword_query(query, LEXICAL_ONLY_MAX_TERMS)
 
-@app.route('/chat', methods=['POST'], cors=True)
-def chat():
+def retrieve(conn, query, top_k=NUM_RETRIEVAL_RESULTS):
+    index = get_index(conn)
+    if not len(index):
+        return []
+
+    lexical_hits = lexical_search(conn, index, query)
+    if lexical_hits and keyword_only(index.meta, query):
+        ranked = lexical_hits[:top_k]
+    elif lexical_hits:
+        vector_hits = vector_search(conn, index, query, max(top_k, LEXICAL_CANDIDATES))
+        ranked = lexical.reciprocal_rank_fusion(
+            [[chunk_id for chunk_id, _ in vector_hits], [chunk_id for chunk_id, _ in lexical_hits]],
+            k=RRF_K
+        )[:top_k]
+    else:
+        ranked = vector_search(conn, index, query, top_k)
+
+    chunks = index.fetch_chunks(conn, [chunk_id for chunk_id, _ in ranked])
+    return [(float(score),) + chunks[chunk_id] for chunk_id, score in ranked]
+
+
+# Converse request shared by the JSON and streaming endpoints
+SYSTEM_PROMPT = """You are a helpful assistant. Be friendly and conversational.Answer questions using only the provided context.
+        Be concise and direct. Keep responses to 2-3 sentences unless more detail is clearly needed.
+        If the answer is not in the context, say you don't know."""
+
+# A question ready for the model, and what is needed to cache its answer and
+# record it in its session; cache_key is None when it must not be cached
+Prompt = namedtuple('Prompt', ['full_message', 'cache_key', 'query_vec', 'store_version', 'user_message',
+                               'session'])
+
+def request_message():
     request = app.current_request
 
     if not request.json_body:
@@ -74,6 +515,173 @@ def chat():
     user_message = request.json_body.get('message')
     if not user_message:
         raise BadRequestError("Message field is required")
+    return user_message
+
+def load_session(body):
+    """The session a request continues ("session_id") or asks to start
+    ("session": true), or None: single questions create no session, and
+    nothing when sessions are disabled."""
+    session_id = body.get('session_id')
+    if _sessions is None or (session_id is None and not body.get('session')):
+        return None
+    if session_id is not None and not (isinstance(session_id, str) and 0 < len(session_id) <= 128):
+        raise BadRequestError("session_id must be a string of at most 128 characters")
+    return _sessions.load(session_id)
+
+def prepare_chat(user_message, session=None):
+    """Everything before the model call. Returns (cached answer, None) on a
+    response or semantic cache hit, otherwise (None, Prompt).
+
+    Once a session has earlier turns its answers depend on them, so the
+    response and semantic caches are bypassed.
+    """
+    conn = get_db()
+    store_version = conn.version
+    first_turn = session is None or not session.turns
+    try:
+        cache_key = None
+        if first_turn:
+            # Keyed on the store version, so a rebuilt store never serves
+            # answers drawn from the old one
+            cache_key = response_cache_key(user_message, store_version)
+            cached = _response_cache.get(cache_key)
+            app.log.info(f"Response cache {'hit' if cached is not None else 'miss'} ({_response_cache.describe()})")
+            if cached is not None:
+                record_turn(session, user_message, cached)
+                return cached, None
+
+        # The embedding is cached, so retrieval below reuses it for free.
+        # A keyword query that retrieval answers from BM25 alone skips the
+        # semantic cache rather than call Titan just to look it up; a
+        # session always embeds, since its topic is an embedding
+        query_vec = None
+        if session is not None or (SEMANTIC_CACHE_SIZE > 0
+                                   and not keyword_only(vector_store.read_meta(conn), user_message)):
+            query_vec, _ = embed_text(user_message)
+        if first_turn and query_vec is not None and SEMANTIC_CACHE_SIZE > 0:
+            similar = _semantic_cache.get(query_vec, store_version)
+            if similar is not None:
+                answer, similarity = similar
+                app.log.info(f"Semantic cache hit at similarity {similarity:.3f} "
+                             f"(hits={_semantic_cache.hits}, misses={_semantic_cache.misses})")
+                record_turn(session, user_message, answer)
+                return answer, None
+
+        if session is not None and session.on_topic(query_vec, store_version, SESSION_TOPIC_THRESHOLD):
+            app.log.info(f"Follow-up in session {session.id} stays on topic; reusing its context")
+            results = [(None, source, text) for source, text in session.context]
+        else:
+            # Retrieve relevant chunks from SQLite
+            results = retrieve(conn, user_message)
+            if session is not None:
+                # The topic stays the question this context was retrieved
+                # for, so a drifting conversation retrieves again once it
+                # has moved far enough from it
+                session.context = [(source, text) for _, source, text in results]
+                session.topic = query_vec
+                session.store_version = store_version
+    finally:
+        conn.close()
+
+    context = ""
+    for i, (score, source, text) in enumerate(results, 1):
+        context += f"\n[{i}] {text}"
+
+    # Prepare message with context
+    full_message = f"User question: {user_message}\n\nRelevant context:\n{context}" if context else user_message
+    return None, Prompt(full_message, cache_key, query_vec, store_version, user_message, session)
+
+def converse_request(prompt):
+    return dict(
+        modelId=MODEL_ID,
+        system=[
+            {
+                'text': SYSTEM_PROMPT
+            }
+        ],
+        messages=(prompt.session.history(SESSION_HISTORY_TOKENS) if prompt.session is not None else []) + [
+            {
+                'role': 'user',
+                'content': [{'text': prompt.full_message}]
+            }
+        ],
+        inferenceConfig={
+            'temperature': TEMPERATURE
+        },
+        additionalModelRequestFields={},
+        performanceConfig={
+            'latency': LATENCY
+        }
+    )
+
+def remember_answer(prompt, answer):
+    if prompt.cache_key is not None:
+        _response_cache.put(prompt.cache_key, answer)
+        if prompt.query_vec is not None:
+            _semantic_cache.put(prompt.query_vec, answer, prompt.store_version)
+    record_turn(prompt.session, prompt.user_message, answer)
+
+def record_turn(session, user_message, answer):
+    if session is not None:
+        session.add_turn(user_message, answer, SESSION_HISTORY_TOKENS)
+        _sessions.save(session)
+
+def chat_response(answer, session):
+    response = {'response': answer}
+    if session is not None:
+        response['session_id'] = session.id
+    return response
+
+def stream_answer(bedrock_runtime, prompt, should_stop=None):
+    """Yield ('text', delta) as converse_stream produces the answer, then
+    ('done', {cached, session_id, stopReason, usage, latencyMs}).
+
+    Reasoning deltas are not relayed, matching the JSON endpoint.
+    should_stop() is called on every stream event, reasoning included;
+    once it returns true the generator yields ('cancelled', None) and ends.
+    Either way, or when a consumer stops iterating early, the Bedrock
+    stream is closed and the partial answer is not cached.
+    """
+    response = bedrock_runtime.converse_stream(**converse_request(prompt))
+    stream = response['stream']
+    parts = []
+    done = {'cached': False}
+    if prompt.session is not None:
+        done['session_id'] = prompt.session.id
+    try:
+        for event in stream:
+            if should_stop is not None and should_stop():
+                yield 'cancelled', None
+                return
+            if 'contentBlockDelta' in event:
+                text = event['contentBlockDelta']['delta'].get('text')
+                if text:
+                    parts.append(text)
+                    yield 'text', text
+            elif 'messageStop' in event:
+                done['stopReason'] = event['messageStop'].get('stopReason')
+            elif 'metadata' in event:
+                done['usage'] = event['metadata'].get('usage', {})
+                done['latencyMs'] = event['metadata'].get('metrics', {}).get('latencyMs')
+    finally:
+        stream.close()
+
+    if parts:
+        remember_answer(prompt, "".join(parts))
+    yield 'done', done
+
+def cached_answer(answer, session):
+    yield 'text', answer
+    done = {'cached': True}
+    if session is not None:
+        done['session_id'] = session.id
+    yield 'done', done
+
+
+@app.route('/chat', methods=['POST'], cors=True)
+def chat():
+    user_message = request_message()
+    session = load_session(app.current_request.json_body)
 
     bedrock_runtime = boto3.client(
         service_name='bedrock-runtime',
@@ -81,39 +689,12 @@ def chat():
     )
 
     try:
-        # Retrieve relevant chunks from SQLite
-        results = retrieve(user_message)
-        context = ""
-        for i, (score, source, text) in enumerate(results, 1):
-            context += f"\n[{i}] {text}"
-
-        # Prepare message with context
-        full_message = f"User question: {user_message}\n\nRelevant context:\n{context}" if context else user_message
+        cached, prompt = prepare_chat(user_message, session)
+        if cached is not None:
+            return chat_response(cached, session)
 
         # Call Bedrock
-        response = bedrock_runtime.converse(
-            modelId=MODEL_ID,
-            system=[
-                {
-                    'text': """You are a helpful assistant. Be friendly and conversational.Answer questions using only the provided context.
-        Be concise and direct. Keep responses to 2-3 sentences unless more detail is clearly needed.
-        If the answer is not in the context, say you don't know."""
-                }
-            ],
-            messages=[
-                {
-                    'role': 'user',
-                    'content': [{'text': full_message}]
-                }
-            ],
-            inferenceConfig={
-                'temperature': TEMPERATURE
-            },
-            additionalModelRequestFields={},
-            performanceConfig={
-                'latency': LATENCY
-            }
-        )
+        response = bedrock_runtime.converse(**converse_request(prompt))
 
         # Parse response
         ai_response = 'No response generated'
@@ -121,8 +702,9 @@ def chat():
             content = response['output']['message'].get('content', [])
             if content and 'text' in content[0]:
                 ai_response = content[0]['text']
+                remember_answer(prompt, ai_response)
 
-        return {'response': ai_response}
+        return chat_response(ai_response, session)
 
     except Exception as e:
         error_message = str(e)
@@ -130,6 +712,112 @@ def chat():
         raise BadRequestError(f"Error: {error_message}")
 
 
+# --- WebSocket API ---
+#
+# Client messages: {"action": "chat", "id": ..., "message": ..., "session": true | "session_id": ...} and
+# {"action": "cancel", "id": ...}. The id is echoed on every reply; it is
+# optional on a chat, but only a chat sent with one can be cancelled, and
+# may be reused once that chat has finished.
+# Replies: {"type": "text", "text": ...} deltas, then one of
+# {"type": "done", ...usage}, {"type": "cancelled"} or {"type": "error", "message": ...}.
+
+def cancel_key(connection_id, request_id):
+    return make_key(connection_id, request_id)
+
+def is_cancelled(connection_id, request_id):
+    # '*' marks the whole connection, once it has disconnected
+    return any(_cancel_flags.get(cancel_key(connection_id, key)) is not None
+               for key in (request_id, '*'))
+
+def ws_send(connection_id, request_id, payload):
+    app.websocket_api.send(connection_id, json.dumps(dict(payload, id=request_id)))
+
+def ws_chat(connection_id, request_id, body):
+    """Answer over the socket as the model streams, stopping (and closing the
+    Bedrock stream) once the client cancels or is gone."""
+    bedrock_runtime = boto3.client(
+        service_name='bedrock-runtime',
+        region_name=AWS_REGION
+    )
+    events = None
+    try:
+        session = load_session(body)
+        cached, prompt = prepare_chat(body['message'], session)
+        checked_at = time.monotonic()
+
+        def should_stop():
+            # Each check is a shared-tier read, so they are rate limited
+            nonlocal checked_at
+            if time.monotonic() - checked_at < WS_CANCEL_CHECK_INTERVAL:
+                return False
+            checked_at = time.monotonic()
+            return is_cancelled(connection_id, request_id)
+
+        if cached is not None:
+            events = cached_answer(cached, session)
+        else:
+            events = stream_answer(bedrock_runtime, prompt, should_stop)
+        for event, data in events:
+            if event == 'cancelled':
+                app.log.info(f"Chat {request_id} on {connection_id} cancelled by the client")
+                ws_send(connection_id, request_id, {'type': 'cancelled'})
+                return
+            payload = {'type': 'text', 'text': data} if event == 'text' else dict(data, type='done')
+            ws_send(connection_id, request_id, payload)
+    except WebsocketDisconnectedError:
+        app.log.info(f"Connection {connection_id} gone, stopped streaming chat {request_id}")
+    except Exception as e:
+        app.log.error(f"Error: {e}")
+        try:
+            ws_send(connection_id, request_id, {'type': 'error', 'message': f"Error: {e}"})
+        except WebsocketDisconnectedError:
+            pass
+    finally:
+        if events is not None:
+            events.close()
+        if request_id is not None:
+            # A cancel outlives only the chat it targeted (one sent before
+            # the chat started still stops it); a later chat may reuse the id
+            _cancel_flags.delete(cancel_key(connection_id, request_id))
+
+
+@app.on_ws_connect()
+def ws_connect(event):
+    app.log.info(f"WebSocket connected: {event.connection_id}")
+
+
+@app.on_ws_message()
+def ws_message(event):
+    try:
+        body = json.loads(event.body)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        ws_send(event.connection_id, None, {'type': 'error', 'message': "Message must be a JSON object"})
+        return
+
+    request_id = body.get('id')
+    action = body.get('action', 'chat')
+    if action == 'cancel':
+        if request_id is None:
+            ws_send(event.connection_id, None, {'type': 'error', 'message': "Cancel requires the id of the chat"})
+            return
+        _cancel_flags.put(cancel_key(event.connection_id, request_id), '1')
+    elif action == 'chat':
+        if not body.get('message'):
+            ws_send(event.connection_id, request_id, {'type': 'error', 'message': "Message field is required"})
+            return
+        ws_chat(event.connection_id, request_id, body)
+    else:
+        ws_send(event.connection_id, request_id, {'type': 'error', 'message': f"Unknown action: {action}"})
+
+
+@app.on_ws_disconnect()
+def ws_disconnect(event):
+    _cancel_flags.put(cancel_key(event.connection_id, '*'), '1')
+    app.log.info(f"WebSocket disconnected: {event.connection_id}")
+
+
 @app.route('/')
 def index():
     return {'hello': 'world'}
\ No newline at end of file
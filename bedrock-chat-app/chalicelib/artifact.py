@@ -0,0 +1,212 @@
+"""
+Compressed S3 artifacts for the vector store.
+
+The build uploads each store file compressed, then a small JSON manifest
+recording every file's object key, compression, raw size and SHA-256, and
+any delta segments (see segments.py) published since, or the shards
+(see shards.py) of a sharded store. The Lambda polls the
+manifest (its ETag is the store version) and decompresses
+each file while it downloads, so there is no second pass over a compressed
+copy on disk.
+
+Objects larger than one transfer part are instead fetched with parallel
+ranged GETs into a preallocated file, sized by an s3transfer TransferConfig,
+and decompressed from local disk afterwards: past a few hundred MB a single
+stream, not decompression, is what limits a cold start.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chalicelib import vector_store
+
+MANIFEST_KEY = "vector_store.json"
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst', 'none': ''}
+CHUNK_SIZE = 1024 * 1024
+
+
+def _zstandard():
+    # Optional: gzip needs nothing beyond the standard library
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression requires the zstandard package")
+    return zstandard
+
+
+def _chunks(f):
+    return iter(lambda: f.read(CHUNK_SIZE), b"")
+
+
+def compress(path, compression):
+    """Compress path to a sibling file; return (compressed path, manifest entry)."""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    digest = hashlib.sha256()
+    size = 0
+    out_path = path + SUFFIXES[compression]
+    with open(path, "rb") as src:
+        if compression == 'none':
+            dst = None
+        elif compression == 'gzip':
+            dst = gzip.open(out_path, "wb", compresslevel=6)
+        else:
+            dst = _zstandard().ZstdCompressor(level=10).stream_writer(open(out_path, "wb"))
+        try:
+            for chunk in _chunks(src):
+                digest.update(chunk)
+                size += len(chunk)
+                if dst is not None:
+                    dst.write(chunk)
+        finally:
+            if dst is not None:
+                dst.close()
+    stored_size = os.path.getsize(out_path)
+    return out_path, {'compression': compression, 'size': size, 'sha256': digest.hexdigest(),
+                      'stored_size': stored_size}
+
+
+def write_manifest(files, deltas=(), sources=None, next_id=None, shards=None):
+    """files maps local file name -> manifest entry (including its S3 key)
+    for the base store; deltas lists delta segment entries, oldest first.
+    sources (file name -> SHA-256) and next_id let a delta build diff the
+    knowledge base and continue the chunk ids without the store itself.
+    shards maps the shard names in a sharded base's routing store to their
+    entries."""
+    manifest = {'files': files, 'deltas': list(deltas), 'sources': sources or {}, 'next_id': next_id,
+                'shards': shards or {}}
+    return json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+
+
+def read_manifest(body):
+    manifest = json.loads(body)
+    manifest.setdefault('deltas', [])
+    manifest.setdefault('sources', {})
+    manifest.setdefault('next_id', None)
+    manifest.setdefault('shards', {})
+    return manifest
+
+
+def download(s3, bucket, entry, out_path, transfer_config=None):
+    """Fetch one manifest entry from S3 into out_path, decompressing it, and
+    check its raw size and SHA-256.
+
+    Returns [(part offset, bytes, seconds)] for a ranged download, or [] when
+    the object was streamed.
+    """
+    stored_size = entry.get('stored_size')
+    if stored_size is None:
+        stored_size = s3.head_object(Bucket=bucket, Key=entry['key'])["ContentLength"]
+    if (transfer_config is None or transfer_config.max_request_concurrency <= 1
+            or stored_size <= transfer_config.multipart_chunksize):
+        body = s3.get_object(Bucket=bucket, Key=entry['key'])["Body"]
+        _decompress(body, entry, out_path)
+        return []
+
+    if entry['compression'] == 'none':
+        parts = download_ranged(s3, bucket, entry['key'], stored_size, out_path, transfer_config)
+        with open(out_path, "rb") as f:
+            _check(entry, *_digest(_chunks(f)))
+        return parts
+
+    part_path = out_path + ".part"
+    try:
+        parts = download_ranged(s3, bucket, entry['key'], stored_size, part_path, transfer_config)
+        with open(part_path, "rb") as f:
+            _decompress(f, entry, out_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return parts
+
+
+def _decompress(stream, entry, out_path):
+    if entry['compression'] == 'gzip':
+        reader = gzip.GzipFile(fileobj=stream, mode="rb")
+    elif entry['compression'] == 'zstd':
+        reader = _zstandard().ZstdDecompressor().stream_reader(stream)
+    else:
+        reader = stream
+    with open(out_path, "wb") as f:
+        size, digest = _digest(_chunks(reader), f.write)
+    _check(entry, size, digest)
+
+
+def _digest(chunks, sink=None):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+        if sink is not None:
+            sink(chunk)
+    return size, digest.hexdigest()
+
+
+def _check(entry, size, digest):
+    if size != entry['size'] or digest != entry['sha256']:
+        raise vector_store.CorruptStoreError(
+            f"{entry['key']} decompressed to {size} bytes with SHA-256 {digest}, "
+            f"manifest expects {entry['size']} bytes with {entry['sha256']}"
+        )
+
+
+class _Throttle:
+    """Caps the combined rate of all part downloads at max_bandwidth bytes/s."""
+
+    def __init__(self, max_bandwidth):
+        self.max_bandwidth = max_bandwidth
+        self.start = time.monotonic()
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def consume(self, count):
+        if not self.max_bandwidth:
+            return
+        with self._lock:
+            self.total += count
+            ahead = self.total / self.max_bandwidth - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def download_ranged(s3, bucket, key, size, out_path, transfer_config):
+    """Download key with concurrent ranged GETs of multipart_chunksize bytes,
+    each written at its offset in a file preallocated to size.
+
+    Returns [(offset, bytes, seconds)] per part, in offset order.
+    """
+    part_size = transfer_config.multipart_chunksize
+    throttle = _Throttle(transfer_config.max_bandwidth)
+    fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+
+        def fetch(offset):
+            start = time.perf_counter()
+            end = min(offset + part_size, size) - 1
+            body = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={offset}-{end}")["Body"]
+            position = offset
+            for chunk in iter(lambda: body.read(transfer_config.io_chunksize), b""):
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+                throttle.consume(len(chunk))
+            if position != end + 1:
+                raise vector_store.CorruptStoreError(
+                    f"Part {offset}-{end} of {key} ended after {position - offset} bytes"
+                )
+            return offset, position - offset, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=transfer_config.max_request_concurrency) as pool:
+            return list(pool.map(fetch, range(0, size, part_size)))
+    finally:
+        os.close(fd)
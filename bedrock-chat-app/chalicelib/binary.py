@@ -0,0 +1,70 @@
+"""
+Binary (sign-bit) embeddings and Hamming-distance prefiltering.
+
+Titan Embed v2 returns a 0/1 vector when asked for the "binary" embedding
+type. Packed eight bits to a byte, a 1024-dim vector is 128 bytes, and the
+Hamming distance to every stored vector is one XOR plus a popcount over a
+uint8 matrix.
+"""
+
+import numpy as np
+
+from chalicelib import scoring, vector_store
+
+# Popcount of every byte value, for NumPy builds without np.bitwise_count.
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+# Rows XORed per block, bounding the temporary buffer.
+BLOCK_ROWS = 65536
+
+
+def pack(bits):
+    return np.packbits(np.asarray(bits, dtype=np.uint8))
+
+
+def hamming_distances(bit_matrix, query_bits):
+    distances = np.empty(len(bit_matrix), dtype=np.uint16)
+    for start in range(0, len(bit_matrix), BLOCK_ROWS):
+        xor = np.bitwise_xor(bit_matrix[start:start + BLOCK_ROWS], query_bits)
+        if hasattr(np, 'bitwise_count'):
+            counts = np.bitwise_count(xor)
+        else:
+            counts = _POPCOUNT[xor]
+        distances[start:start + BLOCK_ROWS] = counts.sum(axis=1, dtype=np.uint16)
+    return distances
+
+
+def prefilter(bit_matrix, query_bits, count):
+    """Return the rows of the count smallest Hamming distances, nearest first."""
+    distances = hamming_distances(bit_matrix, query_bits)
+    return scoring.select_top_k(-distances.astype(np.int32), count)
+
+
+def create_table(conn):
+    conn.execute("DROP TABLE IF EXISTS embedding_bits")
+    conn.execute("""
+        CREATE TABLE embedding_bits (
+            chunk_id INTEGER PRIMARY KEY,
+            bits BLOB
+        )
+    """)
+
+
+def write(conn, chunk_id, packed_bits):
+    conn.execute(
+        "INSERT INTO embedding_bits (chunk_id, bits) VALUES (?, ?)",
+        (chunk_id, packed_bits.tobytes())
+    )
+
+
+def load(conn, ids):
+    """Load the packed bit matrix in index row order, or None if the store has none."""
+    if vector_store.read_meta(conn).get('binary') != '1':
+        return None
+    rows = conn.execute("SELECT chunk_id, bits FROM embedding_bits ORDER BY chunk_id").fetchall()
+    if len(rows) != len(ids):
+        return None
+    bit_matrix = np.empty((len(rows), len(rows[0][1]) if rows else 0), dtype=np.uint8)
+    for i, (_, bits) in enumerate(rows):
+        bit_matrix[i] = np.frombuffer(bits, dtype=np.uint8)
+    return bit_matrix
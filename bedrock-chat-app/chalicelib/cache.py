@@ -0,0 +1,376 @@
+"""
+Response and embedding caches.
+
+TieredCache puts a small in-process LRU (L1) in front of an optional shared
+tier (L2) so a cold container can still hit entries other containers wrote:
+
+- DynamoDBBackend: shared by every container, for production
+- SQLiteBackend: a file in /tmp, private to the container but larger than
+  L1 and surviving the runtime re-initializing; for local development
+- MemoryBackend: a process-wide dict, for tests and `chalice local`
+"""
+
+import hashlib
+import logging
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+import numpy as np
+
+from chalicelib import scoring
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts):
+    """Stable, bounded-length cache key from arbitrary parts."""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def normalize_text(text):
+    return " ".join(text.lower().split())
+
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SemanticCache:
+    """Answers reused for questions whose embeddings are near-identical.
+
+    Entries are (unit query embedding, answer, store version) held in one
+    preallocated matrix, so a lookup is the same single matrix-vector
+    product used for retrieval. Entries expire after ttl_seconds or when the
+    store version changes; when full, the least recently used is replaced.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, threshold):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._matrix = None
+        self._answers = [None] * max_entries
+        self._versions = [None] * max_entries
+        self._stored_at = np.full(max_entries, -np.inf)
+        self._last_used = np.full(max_entries, -np.inf)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _live_rows(self, version, now):
+        fresh = np.flatnonzero(self._stored_at > now - self.ttl_seconds)
+        return np.array([row for row in fresh if self._versions[row] == version], dtype=np.intp)
+
+    def get(self, query_vec, version):
+        """Return (answer, similarity) of the closest live entry at or above
+        the threshold, or None."""
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            rows = self._live_rows(version, now) if self._matrix is not None else []
+            if len(rows):
+                best, scores = scoring.top_k(self._matrix[rows], query_vec, 1)
+                if scores[0] >= self.threshold:
+                    row = rows[best[0]]
+                    self._last_used[row] = now
+                    self.hits += 1
+                    return self._answers[row], float(scores[0])
+            self.misses += 1
+            return None
+
+    def put(self, query_vec, answer, version):
+        if self.max_entries <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(query_vec)), dtype=np.float32)
+            # Expired entries look unused, so they are recycled first.
+            self._last_used[self._stored_at <= now - self.ttl_seconds] = -np.inf
+            row = int(np.argmin(self._last_used))
+            self._matrix[row] = query_vec
+            self._answers[row] = answer
+            self._versions[row] = version
+            self._stored_at[row] = now
+            self._last_used[row] = now
+
+
+# --- Shared (L2) backends: get(key) -> bytes or None, put(key, bytes, ttl_seconds), delete(key) ---
+
+class MemoryBackend:
+    def __init__(self, max_entries):
+        self._entries = LRUCache(max_entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] <= time.time()):
+            return None
+        return entry[1]
+
+    def put(self, key, value, ttl_seconds=None):
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        self._entries.put(key, (expires_at, value))
+
+    def delete(self, key):
+        self._entries.delete(key)
+
+
+class SQLiteBackend:
+    """Bounded key -> bytes store in a local SQLite file, evicting the least
+    recently used entries."""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    expires_at REAL,
+                    last_used REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe to share
+        # between the threads `chalice local` serves requests on.
+        return sqlite3.connect(self.path, timeout=1)
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+        finally:
+            conn.close()
+
+    def put(self, key, value, ttl_seconds=None):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl_seconds if ttl_seconds else None, now)
+            )
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, key):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class DynamoDBBackend:
+    """Items are {cache_key (S), value (B), expires_at (N)}; enable DynamoDB
+    TTL on expires_at so expired items are eventually deleted. Reads also
+    check expires_at, since TTL deletion lags."""
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+
+    def get(self, key):
+        item = self.client.get_item(
+            TableName=self.table_name, Key={'cache_key': {'S': key}}
+        ).get('Item')
+        if item is None:
+            return None
+        if 'expires_at' in item and float(item['expires_at']['N']) <= time.time():
+            return None
+        return item['value']['B']
+
+    def put(self, key, value, ttl_seconds=None):
+        item = {'cache_key': {'S': key}, 'value': {'B': value}}
+        if ttl_seconds:
+            item['expires_at'] = {'N': str(int(time.time() + ttl_seconds))}
+        self.client.put_item(TableName=self.table_name, Item=item)
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={'cache_key': {'S': key}})
+
+
+def make_backend(kind, sqlite_path=None, max_entries=4096, table_name=None):
+    """Build the shared tier named by CACHE_BACKEND; None disables it."""
+    if kind in ('', 'none'):
+        return None
+    if kind == 'dynamodb':
+        return DynamoDBBackend(table_name)
+    if kind == 'sqlite':
+        return SQLiteBackend(sqlite_path, max_entries)
+    if kind == 'memory':
+        return MemoryBackend(max_entries)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+# --- Tiered cache ---
+
+class TierStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    def record(self, hit, seconds):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.seconds += seconds
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return "no lookups"
+        return (f"{self.hits}/{lookups} hits ({self.hits / lookups:.0%}), "
+                f"avg {self.seconds / lookups * 1000:.2f} ms")
+
+
+class TieredCache:
+    """L1 in-process LRU in front of an optional shared L2 backend.
+
+    Reads try L1 then L2, writing L2 hits back into L1; writes go to both.
+    Entries expire after ttl_seconds (None keeps them until evicted). L2
+    failures are logged and treated as misses so a cache outage never fails
+    a request. Keys are namespaced by name in L2, so caches can share one
+    backend.
+    """
+
+    def __init__(self, name, max_entries, ttl_seconds=None, backend=None,
+                 encode=lambda value: value, decode=lambda blob: blob):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.l1 = LRUCache(max_entries)
+        self.l2 = backend
+        self.encode = encode
+        self.decode = decode
+        self.l1_stats = TierStats()
+        self.l2_stats = TierStats()
+
+    def get(self, key):
+        start = time.perf_counter()
+        entry = self.l1.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            entry = None
+        self.l1_stats.record(entry is not None, time.perf_counter() - start)
+        if entry is not None:
+            return entry[1]
+        if self.l2 is None:
+            return None
+
+        start = time.perf_counter()
+        try:
+            blob = self.l2.get(f"{self.name}:{key}")
+        except Exception as e:
+            logger.warning(f"{self.name} cache L2 read failed: {e}")
+            blob = None
+        self.l2_stats.record(blob is not None, time.perf_counter() - start)
+        if blob is None:
+            return None
+        value = self.decode(blob)
+        self._put_l1(key, value)
+        return value
+
+    def put(self, key, value):
+        self._put_l1(key, value)
+        if self.l2 is not None:
+            try:
+                self.l2.put(f"{self.name}:{key}", self.encode(value), self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"{self.name} cache L2 write failed: {e}")
+
+    def delete(self, key):
+        self.l1.delete(key)
+        if self.l2 is not None:
+            try:
+                self.l2.delete(f"{self.name}:{key}")
+            except Exception as e:
+                logger.warning(f"{self.name} cache L2 delete failed: {e}")
+
+    def _put_l1(self, key, value):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self.l1.put(key, (expires_at, value))
+
+    def describe(self):
+        l2 = f"L2 {self.l2_stats}" if self.l2 is not None else "no L2"
+        return f"L1 {self.l1_stats}, {l2}"
+
+
+# --- Value encodings for the shared tier ---
+
+def encode_embedding(value):
+    """(float32 vector, packed bits or None) -> bytes, prefixed with the
+    vector length so decoding needs no outside context."""
+    vector, bits = value
+    blob = struct.pack('<I', len(vector)) + np.asarray(vector, dtype='<f4').tobytes()
+    return blob + bits.tobytes() if bits is not None else blob
+
+
+def decode_embedding(blob):
+    (dimensions,) = struct.unpack_from('<I', blob)
+    split = 4 + dimensions * 4
+    vector = np.frombuffer(blob[4:split], dtype='<f4')
+    bits = np.frombuffer(blob[split:], dtype=np.uint8) if len(blob) > split else None
+    return vector, bits
+
+
+def encode_text(value):
+    return value.encode('utf-8')
+
+
+def decode_text(blob):
+    return bytes(blob).decode('utf-8')
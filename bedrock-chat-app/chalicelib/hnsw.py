@@ -0,0 +1,210 @@
+"""
+Hierarchical Navigable Small World (HNSW) graph index in plain NumPy.
+
+The graph is built offline by scripts/build_vectors.py and stored in the
+hnsw_nodes / hnsw_edges tables. Nodes are index rows; on disk they are
+keyed by chunk id so the graph survives a reordering of the embeddings.
+Similarity is the dot product of unit vectors, so larger is closer.
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+from chalicelib import vector_store
+
+NEIGHBOR_DTYPE = np.dtype('<i8')
+
+
+def create_tables(conn):
+    conn.execute("DROP TABLE IF EXISTS hnsw_nodes")
+    conn.execute("DROP TABLE IF EXISTS hnsw_edges")
+    conn.execute("""
+        CREATE TABLE hnsw_nodes (
+            chunk_id INTEGER PRIMARY KEY,
+            level INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE hnsw_edges (
+            layer INTEGER,
+            chunk_id INTEGER,
+            neighbors BLOB,
+            PRIMARY KEY (layer, chunk_id)
+        )
+    """)
+
+
+class HNSWGraph:
+    def __init__(self, matrix, m, levels, layers, entry_point):
+        self.matrix = matrix
+        self.m = m
+        self.levels = levels
+        # layers[l] maps a row to the list of its neighbour rows on layer l
+        self.layers = layers
+        self.entry_point = entry_point
+
+    @property
+    def max_level(self):
+        return len(self.layers) - 1
+
+    # --- Construction ---
+
+    @classmethod
+    def build(cls, matrix, m=16, ef_construction=100, seed=0):
+        rng = np.random.default_rng(seed)
+        level_mult = 1 / math.log(m)
+        levels = np.floor(-np.log(1 - rng.random(len(matrix))) * level_mult).astype(np.int64)
+
+        graph = cls(matrix, m, levels, [], None)
+        for row in range(len(matrix)):
+            graph._insert(row, int(levels[row]), ef_construction)
+        return graph
+
+    def _max_neighbors(self, layer):
+        return 2 * self.m if layer == 0 else self.m
+
+    def _insert(self, row, level, ef_construction):
+        while len(self.layers) <= level:
+            self.layers.append({})
+        for layer in range(level + 1):
+            self.layers[layer][row] = []
+
+        if self.entry_point is None:
+            self.entry_point = row
+            return
+
+        query = self.matrix[row]
+        entry = self.entry_point
+        top = max(int(self.levels[entry]), 0)
+        for layer in range(top, level, -1):
+            entry = self._search_layer(query, [entry], 1, layer)[0][1]
+
+        entries = [entry]
+        for layer in range(min(level, top), -1, -1):
+            found = self._search_layer(query, entries, ef_construction, layer)
+            neighbors = self._select_neighbors(found, self.m)
+            self.layers[layer][row] = neighbors
+            for neighbor in neighbors:
+                links = self.layers[layer][neighbor]
+                links.append(row)
+                if len(links) > self._max_neighbors(layer):
+                    sims = self.matrix[links] @ self.matrix[neighbor]
+                    self.layers[layer][neighbor] = self._select_neighbors(
+                        sorted(zip(sims.tolist(), links), reverse=True),
+                        self._max_neighbors(layer)
+                    )
+            entries = [r for _, r in found]
+
+        if level > top:
+            self.entry_point = row
+
+    def _select_neighbors(self, candidates, count):
+        """Neighbour-selection heuristic: keep a candidate only if it is closer
+        to the base node than to every neighbour already kept, which spreads
+        links across clusters. candidates are (similarity, row), best first."""
+        selected = []
+        for sim, row in candidates:
+            if len(selected) >= count:
+                break
+            if not selected or (self.matrix[selected] @ self.matrix[row]).max() < sim:
+                selected.append(row)
+        # Top up with the closest leftovers so well-connected nodes keep degree.
+        if len(selected) < count:
+            chosen = set(selected)
+            for _, row in candidates:
+                if len(selected) >= count:
+                    break
+                if row not in chosen:
+                    selected.append(row)
+        return selected
+
+    # --- Search ---
+
+    def _search_layer(self, query, entries, ef, layer):
+        """Best-first search on one layer. Returns (similarity, row), best first."""
+        links = self.layers[layer]
+        visited = set(entries)
+        sims = self.matrix[entries] @ query
+        candidates = [(-s, r) for s, r in zip(sims.tolist(), entries)]
+        heapq.heapify(candidates)
+        results = [(s, r) for s, r in zip(sims.tolist(), entries)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, row = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            fresh = [n for n in links[row] if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for sim, neighbor in zip((self.matrix[fresh] @ query).tolist(), fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def search(self, query_vec, k, ef_search=64):
+        """Return (rows, scores) of the approximate k nearest rows, best first."""
+        if self.entry_point is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        entry = self.entry_point
+        for layer in range(self.max_level, 0, -1):
+            entry = self._search_layer(query_vec, [entry], 1, layer)[0][1]
+        found = self._search_layer(query_vec, [entry], max(ef_search, k), 0)[:k]
+        rows = np.array([r for _, r in found], dtype=np.intp)
+        scores = np.array([s for s, _ in found], dtype=np.float32)
+        return rows, scores
+
+    # --- Persistence ---
+
+    def write(self, conn, ids):
+        create_tables(conn)
+        conn.executemany(
+            "INSERT INTO hnsw_nodes (chunk_id, level) VALUES (?, ?)",
+            [(int(ids[row]), int(level)) for row, level in enumerate(self.levels)]
+        )
+        conn.executemany(
+            "INSERT INTO hnsw_edges (layer, chunk_id, neighbors) VALUES (?, ?, ?)",
+            [
+                (layer, int(ids[row]), np.asarray(ids[links], dtype=NEIGHBOR_DTYPE).tobytes())
+                for layer, nodes in enumerate(self.layers)
+                for row, links in nodes.items()
+            ]
+        )
+        vector_store.write_meta(
+            conn,
+            hnsw_m=self.m,
+            hnsw_entry_point=int(ids[self.entry_point]),
+        )
+
+    @classmethod
+    def load(cls, conn, ids, matrix):
+        """Load the graph written by write(), or None if the store has none."""
+        meta = vector_store.read_meta(conn)
+        if 'hnsw_m' not in meta:
+            return None
+
+        def rows_of(chunk_ids):
+            return np.searchsorted(ids, chunk_ids)
+
+        levels = np.zeros(len(ids), dtype=np.int64)
+        nodes = np.array(conn.execute("SELECT chunk_id, level FROM hnsw_nodes").fetchall(),
+                         dtype=np.int64).reshape(-1, 2)
+        levels[rows_of(nodes[:, 0])] = nodes[:, 1]
+
+        layers = [{} for _ in range(int(levels.max(initial=0)) + 1)]
+        for layer, chunk_id, neighbors in conn.execute(
+                "SELECT layer, chunk_id, neighbors FROM hnsw_edges"):
+            links = rows_of(np.frombuffer(neighbors, dtype=NEIGHBOR_DTYPE))
+            layers[layer][int(rows_of(chunk_id))] = links.tolist()
+
+        entry_point = int(rows_of(int(meta['hnsw_entry_point'])))
+        return cls(matrix, int(meta['hnsw_m']), levels, layers, entry_point)
@@ -0,0 +1,118 @@
+"""
+Inverted-file (IVF) approximate index.
+
+Vectors are clustered with spherical k-means; each chunk is assigned to its
+nearest centroid and a query only scores the chunks in the nprobe lists whose
+centroids are closest to it.
+"""
+
+import numpy as np
+
+from chalicelib import scoring, vector_store
+
+
+def train_kmeans(matrix, nlist, iterations=20, seed=0):
+    """Spherical k-means over unit vectors. Returns (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(matrix))
+    centroids = matrix[rng.choice(len(matrix), nlist, replace=False)].copy()
+    assignments = np.zeros(len(matrix), dtype=np.int64)
+
+    for iteration in range(iterations):
+        sims = matrix @ centroids.T
+        new_assignments = sims.argmax(axis=1)
+        if iteration and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Reseed empty lists with the points that fit their centroid worst.
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            worst = np.argsort(sims[np.arange(len(matrix)), assignments])[:len(empty)]
+            sums[empty] = matrix[worst]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids, (matrix @ centroids.T).argmax(axis=1)
+
+
+def create_tables(conn):
+    conn.execute("DROP TABLE IF EXISTS ivf_centroids")
+    conn.execute("DROP TABLE IF EXISTS ivf_assignments")
+    conn.execute("""
+        CREATE TABLE ivf_centroids (
+            list_id INTEGER PRIMARY KEY,
+            centroid BLOB
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE ivf_assignments (
+            chunk_id INTEGER PRIMARY KEY,
+            list_id INTEGER
+        )
+    """)
+
+
+def write(conn, ids, centroids, assignments):
+    create_tables(conn)
+    conn.executemany(
+        "INSERT INTO ivf_centroids (list_id, centroid) VALUES (?, ?)",
+        [(i, vector_store.encode_vector(c)) for i, c in enumerate(centroids)]
+    )
+    conn.executemany(
+        "INSERT INTO ivf_assignments (chunk_id, list_id) VALUES (?, ?)",
+        [(int(chunk_id), int(list_id)) for chunk_id, list_id in zip(ids, assignments)]
+    )
+    vector_store.write_meta(conn, ivf_nlist=len(centroids))
+
+
+class IVFLists:
+    """Centroids plus inverted lists of index rows, stored CSR-style."""
+
+    def __init__(self, centroids, assignments):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.rows = np.argsort(assignments, kind='stable')
+        self.offsets = np.searchsorted(
+            assignments[self.rows], np.arange(len(self.centroids) + 1)
+        )
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, matrix, nlist):
+        # matrix[:] is a view of a float matrix, or a dequantized copy of a
+        # QuantizedMatrix that is dropped once training finishes.
+        centroids, assignments = train_kmeans(matrix[:], nlist)
+        return cls(centroids, assignments)
+
+    @classmethod
+    def load(cls, conn, ids):
+        """Load the lists written by write(), or None if the store has none."""
+        if 'ivf_nlist' not in vector_store.read_meta(conn):
+            return None
+        centroids = np.array([
+            vector_store.decode_vector(c)
+            for (c,) in conn.execute("SELECT centroid FROM ivf_centroids ORDER BY list_id")
+        ], dtype=np.float32)
+        pairs = np.array(
+            conn.execute("SELECT chunk_id, list_id FROM ivf_assignments").fetchall(),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        assignments = np.zeros(len(ids), dtype=np.int64)
+        assignments[np.searchsorted(ids, pairs[:, 0])] = pairs[:, 1]
+        return cls(centroids, assignments)
+
+    def candidates(self, query_vec, nprobe):
+        """Return the index rows in the nprobe lists closest to query_vec."""
+        lists = scoring.select_top_k(self.centroids @ query_vec, nprobe)
+        return np.concatenate(
+            [self.rows[self.offsets[l]:self.offsets[l + 1]] for l in lists]
+        )
@@ -0,0 +1,67 @@
+"""
+Lexical (BM25) retrieval over an SQLite FTS5 index of the chunk text, and
+reciprocal rank fusion (RRF) of lexical and vector rankings.
+"""
+
+import re
+
+from chalicelib import vector_store
+
+_TERM = re.compile(r"\w+")
+
+
+def create_index(conn):
+    """Build an external-content FTS5 table over embeddings.chunk_text."""
+    conn.execute("DROP TABLE IF EXISTS chunks_fts")
+    conn.execute("""
+        CREATE VIRTUAL TABLE chunks_fts USING fts5(
+            chunk_text,
+            content='embeddings',
+            content_rowid='id'
+        )
+    """)
+    conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+    vector_store.write_meta(conn, fts=1)
+
+
+def available(meta):
+    return meta.get('fts') == '1'
+
+
+def terms(text):
+    return _TERM.findall(text.lower())
+
+
+def is_keyword_query(text, max_terms):
+    """Short queries such as a name, skill or employer, which BM25 answers
+    well on its own."""
+    return 0 < len(terms(text)) <= max_terms
+
+
+def search(conn, text, limit):
+    """Return [(chunk_id, bm25 score)] best first; higher scores are better."""
+    query_terms = terms(text)
+    if not query_terms:
+        return []
+    # Quote every term so user input is never parsed as FTS5 syntax.
+    match = " OR ".join(f'"{term}"' for term in query_terms)
+    rows = conn.execute(
+        "SELECT rowid, bm25(chunks_fts) FROM chunks_fts WHERE chunks_fts MATCH ? "
+        "ORDER BY bm25(chunks_fts) LIMIT ?",
+        (match, limit)
+    ).fetchall()
+    # FTS5's bm25() is negated so that ascending order is best first.
+    return [(chunk_id, -score) for chunk_id, score in rows]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked lists of chunk ids into [(chunk_id, score)], best first.
+
+    Each list contributes 1 / (k + rank) per id, so agreement between the
+    lexical and vector rankings outweighs a high rank in either alone.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,123 @@
+"""
+Scalar quantization of the embedding matrix.
+
+int8 stores one signed byte per dimension with a per-dimension scale and
+offset (x ~= offset + scale * code); float16 stores half-precision floats.
+QuantizedMatrix scores directly against the codes and supports the same
+`matrix @ query` / `matrix[rows]` operations the search structures use, so
+IVF and HNSW run unchanged on top of it. Behind int8 codes the embeddings
+table (or sidecar) keeps float16 vectors, read back only to rescore a
+shortlist; float16 codes are the only vectors their store keeps.
+
+Scoring the whole matrix converts codes to float32 a block at a time. For
+int8 that costs little next to the matrix product, but NumPy's float16
+conversion is several times slower than the product itself, so float16 is
+the slower choice for exact search.
+"""
+
+import numpy as np
+
+from chalicelib import scoring, vector_store
+
+MODES = ('int8', 'float16')
+
+# Rows dequantized per block when scoring the whole matrix, bounding the
+# temporary float32 buffer regardless of store size.
+BLOCK_ROWS = 256
+
+
+def create_tables(conn):
+    conn.execute("DROP TABLE IF EXISTS quantization")
+    conn.execute("DROP TABLE IF EXISTS embedding_codes")
+    conn.execute("""
+        CREATE TABLE quantization (
+            scale BLOB,
+            offset BLOB
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE embedding_codes (
+            chunk_id INTEGER PRIMARY KEY,
+            code BLOB
+        )
+    """)
+
+
+class QuantizedMatrix:
+    def __init__(self, codes, scale, offset):
+        self.codes = codes
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.offset = np.asarray(offset, dtype=np.float32)
+
+    @property
+    def mode(self):
+        return 'int8' if self.codes.dtype == np.int8 else 'float16'
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scale.nbytes + self.offset.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def quantize(cls, matrix, mode):
+        if mode == 'float16':
+            dim = matrix.shape[1]
+            return cls(matrix.astype(np.float16), np.ones(dim), np.zeros(dim))
+        if mode != 'int8':
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        low, high = matrix.min(axis=0), matrix.max(axis=0)
+        offset = (high + low) / 2
+        scale = (high - low) / 254
+        scale[scale == 0] = 1
+        codes = np.clip(np.rint((matrix - offset) / scale), -127, 127).astype(np.int8)
+        return cls(codes, scale, offset)
+
+    def __getitem__(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scale + self.offset
+
+    def __matmul__(self, query):
+        # q . (offset + scale * code) == q . offset + (q * scale) . code
+        bias = float(query @ self.offset)
+        scaled = (query * self.scale).astype(np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ scaled + bias
+        return scores
+
+    def write(self, conn, ids):
+        create_tables(conn)
+        conn.execute(
+            "INSERT INTO quantization (scale, offset) VALUES (?, ?)",
+            (vector_store.encode_vector(self.scale), vector_store.encode_vector(self.offset))
+        )
+        conn.executemany(
+            "INSERT INTO embedding_codes (chunk_id, code) VALUES (?, ?)",
+            [(int(chunk_id), code.tobytes()) for chunk_id, code in zip(ids, self.codes)]
+        )
+        vector_store.write_meta(conn, quantization=self.mode)
+
+    @classmethod
+    def load(cls, conn, mode):
+        dtype = np.int8 if mode == 'int8' else np.float16
+        scale, offset = conn.execute("SELECT scale, offset FROM quantization").fetchone()
+        rows = conn.execute("SELECT code FROM embedding_codes ORDER BY chunk_id").fetchall()
+        codes = np.empty((len(rows), len(scale) // vector_store.VECTOR_DTYPE.itemsize), dtype=dtype)
+        for i, (code,) in enumerate(rows):
+            codes[i] = np.frombuffer(code, dtype=dtype)
+        return cls(codes, vector_store.decode_vector(scale), vector_store.decode_vector(offset))
+
+
+def rescore(query_vec, rows, vectors, k):
+    """Rerank a shortlist of rows by their full-precision vectors."""
+    rows = np.asarray(rows)
+    if not len(rows):
+        return rows, np.empty(0, dtype=np.float32)
+    best, scores = scoring.top_k(np.asarray(vectors, dtype=np.float32), query_vec, k)
+    return rows[best], scores
@@ -0,0 +1,27 @@
+"""
+Vectorized similarity scoring and top-k selection.
+"""
+
+import numpy as np
+
+
+def select_top_k(scores, k):
+    """Return the row numbers of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        rows = np.argpartition(-scores, k - 1)[:k]
+    else:
+        rows = np.arange(len(scores))
+    return rows[np.argsort(-scores[rows], kind='stable')]
+
+
+def top_k(matrix, query, k):
+    """Score every row of matrix against query with a single BLAS call.
+
+    Returns (rows, scores) for the k best rows, best first.
+    """
+    scores = matrix @ query
+    rows = select_top_k(scores, k)
+    return rows, scores[rows]
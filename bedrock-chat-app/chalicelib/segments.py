@@ -0,0 +1,161 @@
+"""
+Delta segments layered over an immutable base store.
+
+After a full build, `build_vectors.py delta` publishes only what changed in
+the knowledge base as a small delta segment: an SQLite file with the usual
+embeddings table, holding the new chunks under ids that continue the base's,
+and a tombstones table naming sources whose chunks in earlier segments are
+dead. A changed file is a tombstone for its source plus its new chunks.
+Each delta carries its own FTS5 index over its chunks. The manifest lists the live segments in order, and `build_vectors.py compact`
+folds them back into a new base.
+"""
+
+import sqlite3
+
+import numpy as np
+
+from chalicelib import lexical, scoring, vector_store
+from chalicelib.vector_index import normalize_rows
+
+
+def create_tables(conn):
+    conn.execute("""
+        CREATE TABLE tombstones (
+            source TEXT PRIMARY KEY
+        )
+    """)
+    vector_store.write_meta(conn, segment='delta')
+
+
+def write_tombstones(conn, sources):
+    conn.executemany("INSERT INTO tombstones (source) VALUES (?)", [(source,) for source in sources])
+
+
+class Delta:
+    def __init__(self, path, ids, sources, texts, matrix, tombstones, meta):
+        self.path = path
+        self.ids = ids
+        self.sources = sources
+        self.texts = texts
+        self.matrix = matrix
+        self.tombstones = tombstones
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path):
+        """Read a whole delta into memory; deltas are small by design."""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            meta = vector_store.read_meta(conn)
+            rows = conn.execute(
+                "SELECT id, source, chunk_text, embedding FROM embeddings ORDER BY id"
+            ).fetchall()
+            tombstones = frozenset(source for (source,) in conn.execute("SELECT source FROM tombstones"))
+        finally:
+            conn.close()
+
+        dimensions = int(meta.get('dimensions', 0))
+        matrix = np.empty((len(rows), dimensions), dtype=np.float32)
+        for i, row in enumerate(rows):
+            matrix[i] = vector_store.decode_vector(row[3])
+        if meta.get('normalized') != '1':
+            matrix = normalize_rows(matrix)
+        return cls(
+            path,
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=object),
+            [row[2] for row in rows],
+            matrix,
+            tombstones,
+            meta,
+        )
+
+
+def live_masks(base_sources, deltas):
+    """Return (base mask, [mask per delta]) of the rows that no later
+    segment has tombstoned."""
+    dead = set()
+    delta_masks = [None] * len(deltas)
+    for i in reversed(range(len(deltas))):
+        delta_masks[i] = np.array([source not in dead for source in deltas[i].sources], dtype=bool)
+        dead |= deltas[i].tombstones
+    base_mask = np.array([source not in dead for source in base_sources], dtype=bool)
+    return base_mask, delta_masks
+
+
+class SegmentedIndex:
+    """A base VectorIndex with delta segments applied, never mutated.
+
+    The base keeps its IVF/HNSW/quantized structures untouched: searches
+    over-fetch by the number of tombstoned base chunks and drop them, and the
+    live delta chunks are scored exactly and merged in by score. Delta chunks
+    are in memory, so only base chunks are read through the connection.
+    Lexical search likewise drops tombstoned hits from the base's and each
+    delta's FTS5 index and merges the rest by BM25 score.
+    """
+
+    def __init__(self, version, base, deltas):
+        self.version = version
+        self.base = base
+        base_live, delta_live = live_masks(base.sources, deltas)
+        self.deleted_ids = frozenset(base.ids[~base_live].tolist())
+
+        self.ids = np.concatenate([delta.ids[live] for delta, live in zip(deltas, delta_live)]
+                                  + [np.empty(0, dtype=np.int64)])
+        self.matrix = np.vstack([delta.matrix[live] for delta, live in zip(deltas, delta_live)]
+                                + [np.empty((0, base.dimensions), dtype=np.float32)])
+        self.chunks = {}
+        for delta, live in zip(deltas, delta_live):
+            for row in np.flatnonzero(live):
+                self.chunks[int(delta.ids[row])] = (delta.sources[row], delta.texts[row])
+        # (path, dead rows) of the deltas with an FTS5 index; ones built
+        # before deltas had one are found by vector search only
+        self.fts_segments = [(delta.path, int((~live).sum()))
+                             for delta, live in zip(deltas, delta_live) if lexical.available(delta.meta)]
+
+    def __len__(self):
+        return len(self.base) - len(self.deleted_ids) + len(self.ids)
+
+    @property
+    def meta(self):
+        return self.base.meta
+
+    @property
+    def dimensions(self):
+        return self.base.dimensions
+
+    def search(self, query_vec, k, **options):
+        """Same contract as VectorIndex.search()."""
+        ids, scores = self.base.search(query_vec, k + len(self.deleted_ids), **options)
+        if self.deleted_ids:
+            live = np.array([chunk_id not in self.deleted_ids for chunk_id in ids.tolist()], dtype=bool)
+            ids, scores = ids[live], scores[live]
+        if len(self.ids):
+            rows, delta_scores = scoring.top_k(self.matrix, query_vec, k)
+            ids = np.concatenate([ids, self.ids[rows]])
+            scores = np.concatenate([scores, delta_scores])
+        best = scoring.select_top_k(scores, k)
+        return ids[best], scores[best]
+
+    def lexical_search(self, conn, text, limit):
+        """Same contract as lexical.search(), over the base and the deltas.
+
+        Each segment's BM25 scores use its own term statistics, so merging
+        them by score is approximate until compaction puts every chunk in
+        one index.
+        """
+        hits = lexical.search(conn, text, limit + len(self.deleted_ids))
+        hits = [hit for hit in hits if hit[0] not in self.deleted_ids]
+        for path, dead in self.fts_segments:
+            delta_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                hits += [hit for hit in lexical.search(delta_conn, text, limit + dead) if hit[0] in self.chunks]
+            finally:
+                delta_conn.close()
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)[:limit]
+
+    def fetch_chunks(self, conn, chunk_ids):
+        chunk_ids = [int(i) for i in chunk_ids]
+        found = self.base.fetch_chunks(conn, [i for i in chunk_ids if i not in self.chunks])
+        found.update((i, self.chunks[i]) for i in chunk_ids if i in self.chunks)
+        return found
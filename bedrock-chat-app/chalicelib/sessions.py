@@ -0,0 +1,116 @@
+"""
+Server-side conversation sessions.
+
+A session holds the recent turns of one conversation, plus the retrieved
+context and query embedding of the turn that last ran retrieval, so a
+follow-up on the same topic can reuse that context. Sessions are stored as
+JSON in any of the shared-tier backends from cache.py (DynamoDB in
+production, SQLite or memory locally). They are read straight from the
+backend rather than through an in-process L1, because consecutive turns
+may land on different containers.
+"""
+
+import base64
+import json
+import logging
+import secrets
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token), close enough to
+    budget history without a tokenizer."""
+    return (len(text) + 3) // 4
+
+
+class Session:
+    def __init__(self, session_id, turns=None, context=None, topic=None, store_version=None):
+        self.id = session_id
+        # [{'user': ..., 'assistant': ...}], oldest first
+        self.turns = turns or []
+        # [(source, text)] retrieved for the embedding in topic
+        self.context = context or []
+        self.topic = topic
+        self.store_version = store_version
+
+    def on_topic(self, query_vec, store_version, threshold):
+        """Whether a question with this embedding can reuse the context
+        retrieved for the session's topic."""
+        return (bool(self.context) and self.topic is not None and store_version == self.store_version
+                and float(np.dot(query_vec, self.topic)) >= threshold)
+
+    def history(self, max_tokens):
+        """Converse messages for the most recent turns that fit max_tokens."""
+        messages = []
+        for turn in trim_turns(self.turns, max_tokens):
+            messages.append({'role': 'user', 'content': [{'text': turn['user']}]})
+            messages.append({'role': 'assistant', 'content': [{'text': turn['assistant']}]})
+        return messages
+
+    def add_turn(self, user_message, answer, max_tokens):
+        # Stored history never outgrows what a prompt could use
+        self.turns = trim_turns(self.turns + [{'user': user_message, 'assistant': answer}], max_tokens)
+
+    def to_json(self):
+        topic = None
+        if self.topic is not None:
+            topic = base64.b64encode(np.asarray(self.topic, dtype='<f4').tobytes()).decode('ascii')
+        return json.dumps({'turns': self.turns, 'context': self.context, 'topic': topic,
+                           'store_version': self.store_version})
+
+    @classmethod
+    def from_json(cls, session_id, blob):
+        data = json.loads(blob)
+        topic = data.get('topic')
+        if topic is not None:
+            topic = np.frombuffer(base64.b64decode(topic), dtype='<f4')
+        return cls(session_id, data.get('turns'), [tuple(chunk) for chunk in data.get('context', [])],
+                   topic, data.get('store_version'))
+
+
+def trim_turns(turns, max_tokens):
+    """The most recent turns whose estimated tokens fit max_tokens."""
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        used += estimate_tokens(turn['user']) + estimate_tokens(turn['assistant'])
+        if used > max_tokens:
+            break
+        kept.append(turn)
+    return kept[::-1]
+
+
+class SessionStore:
+    """Sessions in a cache.py backend, expiring ttl_seconds after their last
+    turn. Backend failures are logged and a fresh session is used instead,
+    so a store outage degrades to single-turn chat rather than failing it."""
+
+    def __init__(self, backend, ttl_seconds):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    def load(self, session_id=None):
+        """The stored session session_id names, or a new one.
+
+        Ids are only ever minted here, so an id that names no stored
+        session (made up by a client, or expired) starts a new session
+        under a fresh id rather than being adopted.
+        """
+        if session_id is not None:
+            try:
+                blob = self.backend.get(f"session:{session_id}")
+            except Exception as e:
+                logger.warning(f"Session read failed: {e}")
+                blob = None
+            if blob is not None:
+                return Session.from_json(session_id, bytes(blob).decode('utf-8'))
+        return Session(secrets.token_urlsafe(24))
+
+    def save(self, session):
+        try:
+            self.backend.put(f"session:{session.id}", session.to_json().encode('utf-8'), self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Session write failed: {e}")
@@ -0,0 +1,208 @@
+"""
+Sharded stores for knowledge bases larger than Lambda memory.
+
+The build clusters chunks with spherical k-means and writes each cluster to
+its own self-contained store file (a shard), with contiguous chunk ids. The
+main vector_store.db becomes a routing store: every chunk's id and source,
+plus a shards table of each shard's id range and centroid. A query scores
+the centroids, then loads and searches only the nprobe closest shards.
+
+Shards are fetched on first use and kept under a least-recently-used policy
+twice over: files in /tmp up to a disk budget, and loaded indexes up to a
+memory budget derived from the Lambda's configured memory.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from chalicelib import scoring, vector_store
+from chalicelib.vector_index import VectorIndex, fetch_chunks
+
+
+def create_table(conn):
+    conn.execute("DROP TABLE IF EXISTS shards")
+    conn.execute("""
+        CREATE TABLE shards (
+            shard_id INTEGER PRIMARY KEY,
+            name TEXT,
+            first_id INTEGER,
+            last_id INTEGER,
+            centroid BLOB
+        )
+    """)
+
+
+def write(conn, routes):
+    """routes: [(name, first chunk id, last chunk id, centroid)] in id order."""
+    create_table(conn)
+    conn.executemany(
+        "INSERT INTO shards (shard_id, name, first_id, last_id, centroid) VALUES (?, ?, ?, ?, ?)",
+        [(i, name, first, last, vector_store.encode_vector(centroid))
+         for i, (name, first, last, centroid) in enumerate(routes)]
+    )
+    vector_store.write_meta(conn, sharded=1, shard_count=len(routes))
+
+
+def is_sharded(meta):
+    return meta.get('sharded') == '1'
+
+
+class ShardCache:
+    """Shard files in directory and their loaded indexes, each bounded by
+    size and evicted least recently used first.
+
+    fetch(entry, path) downloads a manifest entry to path.
+    """
+
+    def __init__(self, directory, fetch, max_disk_bytes, max_memory_bytes):
+        self.directory = directory
+        self.fetch = fetch
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._files = OrderedDict()
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        # Per-shard locks for downloads in progress, by path
+        self._fetching = {}
+        self.loads = 0
+        self.downloads = 0
+        # Shards a previous runtime in this container left behind, oldest first
+        if os.path.isdir(directory):
+            paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".db")]
+            for path in sorted(paths, key=os.path.getmtime):
+                self._files[path] = os.path.getsize(path)
+
+    def path(self, entry):
+        """Local path of a shard, downloading it if needed."""
+        path = os.path.join(self.directory, entry['sha256'] + ".db")
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+                return path
+            shard_lock = self._fetching.setdefault(path, threading.Lock())
+        # Held through the download, so concurrent requests for one shard
+        # fetch it once while requests for other shards proceed
+        with shard_lock:
+            with self._lock:
+                if path in self._files:
+                    self._files.move_to_end(path)
+                    return path
+            os.makedirs(self.directory, exist_ok=True)
+            downloaded = not os.path.exists(path)
+            if downloaded:
+                try:
+                    self.fetch(entry, path + ".download")
+                    os.replace(path + ".download", path)
+                finally:
+                    if os.path.exists(path + ".download"):
+                        os.remove(path + ".download")
+            with self._lock:
+                self.downloads += downloaded
+                self._files[path] = os.path.getsize(path)
+                self._fetching.pop(path, None)
+                # Never evict the file just fetched, even if it alone is over budget
+                while sum(self._files.values()) > self.max_disk_bytes and len(self._files) > 1:
+                    evicted, _ = self._files.popitem(last=False)
+                    # Readers that already opened it keep the inode
+                    os.remove(evicted)
+            return path
+
+    def index(self, entry):
+        """Loaded VectorIndex of a shard."""
+        key = entry['sha256']
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+        conn = sqlite3.connect(f"file:{self.path(entry)}?mode=ro", uri=True)
+        try:
+            index = VectorIndex.load(conn, key, search_mode='exact')
+        finally:
+            conn.close()
+        with self._lock:
+            self._indexes[key] = index
+            self.loads += 1
+            while (sum(i.matrix.nbytes for i in self._indexes.values()) > self.max_memory_bytes
+                   and len(self._indexes) > 1):
+                self._indexes.popitem(last=False)
+        return index
+
+    def describe(self):
+        return (f"{len(self._indexes)} shards in memory, {len(self._files)} on disk, "
+                f"{self.loads} loads, {self.downloads} downloads")
+
+
+class ShardedIndex:
+    """Base index of a sharded store, with the VectorIndex interface that
+    SegmentedIndex relies on. Never mutated; loaded shards live in the
+    shared ShardCache."""
+
+    def __init__(self, version, ids, sources, meta, names, first_ids, centroids, entries, cache, nprobe):
+        self.version = version
+        self.ids = ids
+        self.sources = sources
+        self.meta = meta
+        self.names = names
+        self.first_ids = first_ids
+        self.centroids = centroids
+        self.entries = entries
+        self.cache = cache
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimensions(self):
+        return self.centroids.shape[1]
+
+    @classmethod
+    def load(cls, conn, version, entries, cache, nprobe):
+        """Load the routing store behind conn; entries maps shard names to
+        their manifest entries."""
+        meta = vector_store.read_meta(conn)
+        rows = conn.execute("SELECT id, source FROM embeddings ORDER BY id").fetchall()
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        sources = np.array([r[1] for r in rows], dtype=object)
+        routes = conn.execute("SELECT name, first_id, centroid FROM shards ORDER BY shard_id").fetchall()
+        missing = [name for name, _, _ in routes if name not in entries]
+        if missing:
+            raise vector_store.CorruptStoreError(f"Manifest lists no shard files for {missing}")
+        centroids = np.array([vector_store.decode_vector(r[2]) for r in routes], dtype=np.float32)
+        return cls(version, ids, sources, meta, [r[0] for r in routes],
+                   np.array([r[1] for r in routes], dtype=np.int64), centroids, entries, cache, nprobe)
+
+    def route(self, query_vec):
+        """Names of the nprobe shards whose centroids are closest to the query."""
+        rows, _ = scoring.top_k(self.centroids, query_vec, self.nprobe)
+        return [self.names[row] for row in rows]
+
+    def search(self, query_vec, k, mode='exact', conn=None, **options):
+        """Same contract as VectorIndex.search(), over the routed shards."""
+        ids, scores = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.float32)]
+        for name in self.route(query_vec):
+            shard_ids, shard_scores = self.cache.index(self.entries[name]).search(
+                query_vec, k, mode=mode, **options
+            )
+            ids.append(shard_ids)
+            scores.append(shard_scores)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        best = scoring.select_top_k(scores, k)
+        return ids[best], scores[best]
+
+    def fetch_chunks(self, conn, chunk_ids):
+        chunk_ids = np.asarray([int(i) for i in chunk_ids], dtype=np.int64)
+        shard_rows = np.searchsorted(self.first_ids, chunk_ids, side='right') - 1
+        found = {}
+        for row in np.unique(shard_rows):
+            path = self.cache.path(self.entries[self.names[row]])
+            shard_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                found.update(fetch_chunks(shard_conn, chunk_ids[shard_rows == row]))
+            finally:
+                shard_conn.close()
+        return found
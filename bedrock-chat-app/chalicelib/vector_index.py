@@ -0,0 +1,195 @@
+"""
+In-memory embedding index kept warm across Lambda invocations.
+
+A VectorIndex is built once per store version and never mutated, so a
+request can keep using the instance it picked up even if another thread
+swaps in a newer one.
+"""
+
+import numpy as np
+
+from chalicelib import binary, hnsw, ivf, quantization, scoring, vector_store
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def fetch_chunks(conn, chunk_ids):
+    """{chunk id: (source, text)} for the ids stored behind conn."""
+    chunk_ids = [int(i) for i in chunk_ids]
+    if not chunk_ids:
+        return {}
+    placeholders = ",".join("?" * len(chunk_ids))
+    rows = conn.execute(
+        f"SELECT id, source, chunk_text FROM embeddings WHERE id IN ({placeholders})",
+        chunk_ids
+    ).fetchall()
+    return {chunk_id: (source, text) for chunk_id, source, text in rows}
+
+
+class VectorIndex:
+    def __init__(self, version, ids, sources, matrix, meta, ivf_lists=None, hnsw_graph=None,
+                 bit_matrix=None, vectors=None):
+        self.version = version
+        self.ids = ids
+        self.sources = sources
+        self.matrix = matrix
+        self.meta = meta
+        self.ivf_lists = ivf_lists
+        self.hnsw_graph = hnsw_graph
+        self.bit_matrix = bit_matrix
+        # Full-precision vectors when they are addressable without SQLite:
+        # the float matrix itself, or the memory-mapped sidecar behind codes.
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimensions(self):
+        return self.matrix.shape[1]
+
+    @property
+    def quantized(self):
+        return isinstance(self.matrix, quantization.QuantizedMatrix)
+
+    @classmethod
+    def load(cls, conn, version, ivf_nlist=0, use_codes=True, search_mode=None):
+        """Load the store behind conn.
+
+        Float vectors come from the memory-mapped vectors.npy sidecar when
+        the store has one, otherwise from the embeddings table, or from
+        float16 codes for a store that keeps no other vectors. If the store
+        carries quantized codes they are scored instead of the float vectors
+        unless use_codes is False. Of the IVF lists, HNSW graph and packed
+        binary embeddings written by the build, only the one search_mode
+        uses is loaded (all of them when search_mode is None, none for
+        'exact'); without stored IVF lists, setting ivf_nlist trains them here.
+        """
+        meta = vector_store.read_meta(conn)
+        mode = meta.get('quantization')
+        use_codes = use_codes and mode in quantization.MODES
+
+        if meta.get('vector_layout') == 'npy':
+            ids, sources = cls._read_ids(conn)
+            vectors = vector_store.open_sidecar(conn, meta, len(ids))
+        elif use_codes or vector_store.embedding_dtype(meta) is None:
+            ids, sources = cls._read_ids(conn)
+            vectors = None
+        else:
+            ids, sources, vectors = cls._read_embeddings(conn, meta)
+
+        if use_codes:
+            matrix = quantization.QuantizedMatrix.load(conn, mode)
+        elif vectors is None:
+            matrix = quantization.QuantizedMatrix.load(conn, mode)[:]
+        else:
+            matrix = np.asarray(vectors, dtype=np.float32)
+        return cls._with_indexes(conn, version, ids, sources, matrix, meta, ivf_nlist, vectors, search_mode)
+
+    @staticmethod
+    def _read_ids(conn):
+        rows = conn.execute("SELECT id, source FROM embeddings ORDER BY id").fetchall()
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        sources = np.array([r[1] for r in rows], dtype=object)
+        return ids, sources
+
+    @staticmethod
+    def _read_embeddings(conn, meta):
+        rows = conn.execute("SELECT id, source, embedding FROM embeddings ORDER BY id").fetchall()
+
+        ids = np.empty(len(rows), dtype=np.int64)
+        sources = np.empty(len(rows), dtype=object)
+        matrix = None
+        dtype = vector_store.embedding_dtype(meta)
+        for i, (chunk_id, source, emb) in enumerate(rows):
+            vec = vector_store.decode_vector(emb, dtype)
+            if matrix is None:
+                matrix = np.empty((len(rows), vec.shape[0]), dtype=np.float32)
+            ids[i] = chunk_id
+            sources[i] = source
+            matrix[i] = vec
+
+        if matrix is None:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        # Stores built before vectors were normalized at build time are
+        # normalized once here so search is always a plain dot product.
+        if meta.get('normalized') != '1':
+            matrix = normalize_rows(matrix)
+        return ids, sources, np.ascontiguousarray(matrix, dtype=np.float32)
+
+    @classmethod
+    def _with_indexes(cls, conn, version, ids, sources, matrix, meta, ivf_nlist, vectors, search_mode=None):
+        # Each structure costs cold-start time (the HNSW graph most of all),
+        # so one the configured mode never searches is not loaded
+        ivf_lists = hnsw_graph = bit_matrix = None
+        if search_mode in (None, 'ivf'):
+            ivf_lists = ivf.IVFLists.load(conn, ids)
+            if ivf_lists is None and ivf_nlist and len(ids):
+                ivf_lists = ivf.IVFLists.train(matrix, ivf_nlist)
+        if search_mode in (None, 'hnsw'):
+            hnsw_graph = hnsw.HNSWGraph.load(conn, ids, matrix)
+        if search_mode in (None, 'binary'):
+            bit_matrix = binary.load(conn, ids)
+        return cls(version, ids, sources, matrix, meta, ivf_lists, hnsw_graph, bit_matrix, vectors)
+
+    def search(self, query_vec, k, mode='exact', nprobe=8, ef_search=64, conn=None, rescore=50,
+               query_bits=None, binary_candidates=200):
+        """Return (chunk ids, scores) of the k nearest chunks, best first.
+
+        mode 'exact' scores every chunk, 'ivf' only the nprobe closest IVF
+        lists and 'hnsw' walks the graph keeping ef_search candidates.
+        'binary' keeps the binary_candidates chunks nearest to query_bits by
+        Hamming distance and reranks them by cosine similarity.
+        Approximate modes fall back to exact search when the store has no
+        index for them, or when the probed IVF lists hold fewer than k chunks.
+
+        On a quantized index the best `rescore` candidates are reranked with
+        their full-precision vectors read through conn, if the store keeps
+        any.
+        """
+        rescorable = self.quantized and vector_store.embedding_dtype(self.meta) is not None
+        shortlist = max(k, rescore) if rescorable and conn is not None else k
+        rows, scores = self.search_rows(
+            query_vec, shortlist, mode, nprobe, ef_search, query_bits, binary_candidates
+        )
+        if shortlist > k:
+            rows, scores = quantization.rescore(query_vec, rows, self.load_vectors(conn, rows), k)
+        return self.ids[rows], scores
+
+    def search_rows(self, query_vec, k, mode, nprobe, ef_search, query_bits=None, binary_candidates=200):
+        """Like search(), but returns index rows instead of chunk ids."""
+        if mode == 'ivf' and self.ivf_lists is not None:
+            candidates = self.ivf_lists.candidates(query_vec, nprobe)
+            if len(candidates) >= k:
+                best, scores = scoring.top_k(self.matrix[candidates], query_vec, k)
+                return candidates[best], scores
+        elif mode == 'hnsw' and self.hnsw_graph is not None:
+            return self.hnsw_graph.search(query_vec, k, ef_search)
+        elif mode == 'binary' and self.bit_matrix is not None and query_bits is not None:
+            candidates = binary.prefilter(self.bit_matrix, query_bits, max(k, binary_candidates))
+            best, scores = scoring.top_k(self.matrix[candidates], query_vec, k)
+            return candidates[best], scores
+        return scoring.top_k(self.matrix, query_vec, k)
+
+    def load_vectors(self, conn, rows):
+        """Read the full-precision vectors of the given rows from the store."""
+        if self.vectors is not None:
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+        chunk_ids = [int(i) for i in self.ids[rows]]
+        placeholders = ",".join("?" * len(chunk_ids))
+        found = dict(conn.execute(
+            f"SELECT id, embedding FROM embeddings WHERE id IN ({placeholders})",
+            chunk_ids
+        ).fetchall())
+        dtype = vector_store.embedding_dtype(self.meta)
+        vectors = np.array([vector_store.decode_vector(found[i], dtype) for i in chunk_ids], dtype=np.float32)
+        if self.meta.get('normalized') != '1':
+            vectors = normalize_rows(vectors)
+        return vectors
+
+    def fetch_chunks(self, conn, chunk_ids):
+        return fetch_chunks(conn, chunk_ids)
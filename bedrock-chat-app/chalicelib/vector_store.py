@@ -0,0 +1,159 @@
+"""
+On-disk format of the SQLite vector store.
+
+Shared by scripts/build_vectors.py (writer) and app.py (reader) so both
+sides agree on the schema version and how vectors are encoded.
+"""
+
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+# Schema versions:
+#   1 - embeddings stored as JSON text (no store_meta table)
+#   2 - embeddings stored as packed little-endian float32 BLOBs
+SCHEMA_VERSION = 2
+VECTOR_DTYPE = np.dtype('<f4')
+# A quantized store keeps its full-precision vectors (the embeddings table
+# or the sidecar) only as precise as rescoring needs, recorded as the
+# embedding_dtype meta value: float16 behind int8 codes, and none at all
+# behind float16 codes, which are precise enough to rescore with themselves
+EMBEDDING_DTYPES = {'float32': VECTOR_DTYPE, 'float16': np.dtype('<f2')}
+
+# Output sizes Titan Embed v2 accepts for its "dimensions" request field
+TITAN_V2_DIMENSIONS = (256, 512, 1024)
+
+
+class IncompatibleStoreError(Exception):
+    """The store was built with a different embedding model or size than
+    the one used for queries, so its scores would be meaningless."""
+
+
+def create_schema(conn):
+    conn.execute("""
+        CREATE TABLE embeddings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT,
+            chunk_text TEXT,
+            embedding BLOB
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    write_meta(conn, schema_version=SCHEMA_VERSION)
+
+
+def write_meta(conn, **values):
+    conn.executemany(
+        "INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)",
+        [(key, str(value)) for key, value in values.items()]
+    )
+
+
+def read_meta(conn):
+    has_meta = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'store_meta'"
+    ).fetchone()
+    if not has_meta:
+        return {'schema_version': '1'}
+    return dict(conn.execute("SELECT key, value FROM store_meta").fetchall())
+
+
+def embedding_dtype(meta):
+    """dtype of the store's full-precision vectors, or None if it has none."""
+    return EMBEDDING_DTYPES.get(meta.get('embedding_dtype', 'float32'))
+
+
+def schema_version(conn):
+    return int(read_meta(conn).get('schema_version', '1'))
+
+
+class CorruptStoreError(Exception):
+    """The store's files are missing, truncated or inconsistent."""
+
+
+def sidecar_path(conn, meta):
+    """Path of the vectors.npy sidecar, which lives next to the SQLite file."""
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.join(os.path.dirname(db_file), meta['vector_file'])
+
+
+def write_sidecar(conn, matrix, path, dtype=VECTOR_DTYPE):
+    """Move the float vectors out of the embeddings table into an .npy file.
+
+    matrix rows must be in ascending id order, the order readers assume.
+    """
+    np.save(path, np.ascontiguousarray(matrix, dtype=dtype))
+    conn.execute("UPDATE embeddings SET embedding = NULL")
+    write_meta(conn, vector_layout='npy', vector_file=os.path.basename(path), vector_count=len(matrix))
+
+
+def open_sidecar(conn, meta, count):
+    """Memory-map the sidecar read-only; scoring then reads straight from the
+    page cache without deserializing anything."""
+    return check_sidecar(sidecar_path(conn, meta), count, embedding_dtype(meta))
+
+
+def check_sidecar(path, count, dtype=VECTOR_DTYPE):
+    if not os.path.exists(path):
+        raise CorruptStoreError(f"Vector sidecar {path} is missing")
+    vectors = np.load(path, mmap_mode='r')
+    if vectors.dtype != dtype or vectors.ndim != 2 or len(vectors) != count:
+        raise CorruptStoreError(
+            f"Vector sidecar {path} holds {vectors.shape} {vectors.dtype}, expected {count} rows"
+        )
+    return vectors
+
+
+def verify(path):
+    """Check a freshly downloaded store opens and has a schema this code
+    reads, before it replaces the live one. Returns its metadata."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        meta = read_meta(conn)
+        conn.execute("SELECT id FROM embeddings LIMIT 1").fetchall()
+    except sqlite3.DatabaseError as e:
+        raise CorruptStoreError(f"{path} is not a readable vector store: {e}")
+    finally:
+        conn.close()
+    version = int(meta.get('schema_version', '1'))
+    if version > SCHEMA_VERSION:
+        raise IncompatibleStoreError(
+            f"Vector store has schema version {version}, this code reads up to {SCHEMA_VERSION}"
+        )
+    return meta
+
+
+def check_compatible(meta, dimensions, model_id, expected_dimensions):
+    """Raise IncompatibleStoreError unless the store's embeddings match the
+    query-side model and dimensions. dimensions is the stored vector size,
+    used for stores that predate the metadata."""
+    stored_model = meta.get('embedding_model', model_id)
+    stored_dimensions = int(meta.get('dimensions', dimensions))
+    if stored_model != model_id:
+        raise IncompatibleStoreError(
+            f"Vector store was built with {stored_model}, queries use {model_id}"
+        )
+    if stored_dimensions != expected_dimensions:
+        raise IncompatibleStoreError(
+            f"Vector store has {stored_dimensions}-dim embeddings, "
+            f"queries use {expected_dimensions} (EMBEDDING_DIMENSIONS)"
+        )
+
+
+def encode_vector(vec, dtype=VECTOR_DTYPE):
+    return np.asarray(vec, dtype=dtype).tobytes()
+
+
+def decode_vector(value, dtype=VECTOR_DTYPE):
+    # BLOBs come back from sqlite3 as bytes and are viewed without copying;
+    # anything else is a version 1 JSON-encoded store.
+    if isinstance(value, (bytes, memoryview)):
+        return np.frombuffer(value, dtype=dtype)
+    return np.array(json.loads(value), dtype=VECTOR_DTYPE)
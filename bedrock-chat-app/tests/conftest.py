@@ -0,0 +1,7 @@
+import os
+
+# app.py reads its configuration when imported: keep the caches and sessions
+# in memory rather than in /tmp or DynamoDB
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['SESSION_BACKEND'] = 'memory'
@@ -0,0 +1,143 @@
+import io
+import os
+import sys
+
+import pytest
+from boto3.s3.transfer import TransferConfig
+
+import app as chat_app
+from chalicelib import artifact, vector_store
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import build_vectors  # noqa: E402
+
+PART_SIZE = 16 * 1024
+
+
+class StubS3:
+    """Serves objects from memory, honouring Range like S3 does."""
+
+    def __init__(self, objects=None, truncate_parts=False):
+        self.objects = objects or {}
+        self.truncate_parts = truncate_parts
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key]
+        if Range is not None:
+            self.ranges.append(Range)
+            start, end = (int(x) for x in Range[len("bytes="):].split("-"))
+            data = data[start:end + 1]
+            if self.truncate_parts:
+                data = data[:-1]
+        return {"Body": io.BytesIO(data)}
+
+    def upload_file(self, path, bucket, key):
+        with open(path, "rb") as f:
+            self.objects[key] = f.read()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+
+def upload(tmp_path, compression, size=200 * 1024):
+    """Compress a test file the way the build does; return (S3 stub, entry, raw bytes)."""
+    raw = os.urandom(size // 2) + b"vector store " * (size // 26)
+    path = tmp_path / "vector_store.db"
+    path.write_bytes(raw)
+    out_path, entry = artifact.compress(str(path), compression)
+    entry['key'] = "store/vector_store.db" + artifact.SUFFIXES[compression]
+    with open(out_path, "rb") as f:
+        return StubS3({entry['key']: f.read()}), entry, raw
+
+
+def ranged_config():
+    return TransferConfig(multipart_chunksize=PART_SIZE, max_concurrency=4)
+
+
+@pytest.mark.parametrize("compression", ['gzip', 'none'])
+def test_download_streams_and_decompresses(tmp_path, compression):
+    s3, entry, raw = upload(tmp_path, compression)
+    out_path = tmp_path / "out.db"
+
+    parts = artifact.download(s3, "bucket", entry, str(out_path))
+
+    assert parts == [] and s3.ranges == []
+    assert out_path.read_bytes() == raw
+
+
+@pytest.mark.parametrize("compression", ['gzip', 'none'])
+def test_large_objects_are_fetched_in_ranged_parts(tmp_path, compression):
+    s3, entry, raw = upload(tmp_path, compression)
+    out_path = tmp_path / "out.db"
+
+    parts = artifact.download(s3, "bucket", entry, str(out_path), ranged_config())
+
+    assert [offset for offset, _, _ in parts] == list(range(0, entry['stored_size'], PART_SIZE))
+    assert sum(size for _, size, _ in parts) == entry['stored_size']
+    assert out_path.read_bytes() == raw
+    assert not os.path.exists(str(out_path) + ".part")
+
+
+def test_download_without_stored_size_asks_s3(tmp_path):
+    s3, entry, raw = upload(tmp_path, 'gzip')
+    del entry['stored_size']
+    out_path = tmp_path / "out.db"
+
+    artifact.download(s3, "bucket", entry, str(out_path), ranged_config())
+
+    assert s3.ranges and out_path.read_bytes() == raw
+
+
+def test_short_part_is_corrupt(tmp_path):
+    s3, entry, _ = upload(tmp_path, 'gzip')
+    s3.truncate_parts = True
+
+    with pytest.raises(vector_store.CorruptStoreError):
+        artifact.download(s3, "bucket", entry, str(tmp_path / "out.db"), ranged_config())
+    assert not os.path.exists(str(tmp_path / "out.db.part"))
+
+
+def test_download_file_logs_every_part(tmp_path, monkeypatch, caplog):
+    s3, entry, _ = upload(tmp_path, 'gzip')
+    monkeypatch.setattr(chat_app, 'TRANSFER_CONFIG', ranged_config())
+    # app.log does not propagate to the root logger caplog listens on
+    chat_app.app.log.addHandler(caplog.handler)
+    try:
+        chat_app.download_file(s3, entry, str(tmp_path / "out.db"))
+    finally:
+        chat_app.app.log.removeHandler(caplog.handler)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert sum(" part at " in message for message in messages) == len(s3.ranges) > 1
+    assert any(message.startswith(f"Fetched {entry['key']}") for message in messages)
+
+
+def test_checksum_mismatch_is_corrupt(tmp_path):
+    s3, entry, _ = upload(tmp_path, 'gzip')
+    entry['sha256'] = "0" * 64
+
+    with pytest.raises(vector_store.CorruptStoreError):
+        artifact.download(s3, "bucket", entry, str(tmp_path / "out.db"))
+
+
+def test_each_build_uploads_under_new_keys(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s3 = StubS3()
+    keys = []
+    for content in (b"first build", b"second build"):
+        (tmp_path / build_vectors.DB_PATH).write_bytes(content)
+        build_vectors.upload(s3, {}, 1)
+        manifest = artifact.read_manifest(s3.objects[artifact.MANIFEST_KEY])
+        keys.append(manifest['files']['vector_store.db']['key'])
+
+    assert keys[0] != keys[1]
+    assert all(key.startswith("store/vector_store-") for key in keys)
+    # The first build's object is still there for a Lambda reading the old manifest
+    assert set(keys) <= set(s3.objects)
+    entry = manifest['files']['vector_store.db']
+    artifact.download(s3, "bucket", entry, str(tmp_path / "out.db"))
+    assert (tmp_path / "out.db").read_bytes() == b"second build"
@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+
+import app as chat_app
+from chalicelib import cache
+
+
+class StubDynamoDB:
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, TableName, Key):
+        item = self.items.get(Key['cache_key']['S'])
+        return {'Item': item} if item is not None else {}
+
+    def put_item(self, TableName, Item):
+        self.items[Item['cache_key']['S']] = Item
+
+
+class FailingBackend:
+    def get(self, key):
+        raise ConnectionError("table unavailable")
+
+    def put(self, key, value, ttl_seconds=None):
+        raise ConnectionError("table unavailable")
+
+
+def test_cold_container_reads_what_another_container_wrote():
+    backend = cache.MemoryBackend(16)
+    writer = cache.TieredCache('response', 4, backend=backend,
+                               encode=cache.encode_text, decode=cache.decode_text)
+    reader = cache.TieredCache('response', 4, backend=backend,
+                               encode=cache.encode_text, decode=cache.decode_text)
+    writer.put('k', "answer")
+
+    assert reader.get('k') == "answer"
+    assert (reader.l1_stats.misses, reader.l2_stats.hits) == (1, 1)
+    # The L2 hit was copied into L1
+    assert reader.get('k') == "answer" and reader.l1_stats.hits == 1
+
+
+def test_l2_failures_are_misses():
+    tiered = cache.TieredCache('response', 4, backend=FailingBackend())
+    tiered.put('k', "answer")
+    tiered.l1 = cache.LRUCache(4)
+
+    assert tiered.get('k') is None
+    assert tiered.l2_stats.misses == 1
+
+
+def test_dynamodb_items_expire():
+    client = StubDynamoDB()
+    backend = cache.DynamoDBBackend('table', client)
+    backend.put('kept', b"1", ttl_seconds=60)
+    backend.put('expired', b"2", ttl_seconds=60)
+    client.items['expired']['expires_at'] = {'N': str(int(time.time()) - 1)}
+
+    assert int(client.items['kept']['expires_at']['N']) >= time.time() + 59
+    assert backend.get('kept') == b"1"
+    assert backend.get('expired') is None
+
+
+def test_every_shared_cache_entry_expires():
+    client = StubDynamoDB()
+    backend = cache.DynamoDBBackend('table', client)
+    for tiered in (chat_app._embedding_cache, chat_app._response_cache, chat_app._cancel_flags):
+        shared = cache.TieredCache(tiered.name, 4, tiered.ttl_seconds, backend=backend, encode=tiered.encode)
+        shared.put('k', (np.ones(4, dtype=np.float32), None) if tiered.name == 'embedding' else "value")
+
+    assert len(client.items) == 3
+    assert all('expires_at' in item for item in client.items.values())
+
+
+def test_embeddings_round_trip_through_the_shared_tier():
+    vector = np.arange(8, dtype=np.float32)
+    bits = np.array([3, 255], dtype=np.uint8)
+
+    decoded_vector, decoded_bits = cache.decode_embedding(cache.encode_embedding((vector, bits)))
+    assert np.array_equal(decoded_vector, vector) and np.array_equal(decoded_bits, bits)
+    assert cache.decode_embedding(cache.encode_embedding((vector, None)))[1] is None
+
+
+def test_lru_evicts_least_recently_used():
+    lru = cache.LRUCache(2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    lru.get('a')
+    lru.put('c', 3)
+
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+
+
+def test_sqlite_tier_survives_reinitializing_and_stays_bounded(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = cache.SQLiteBackend(path, 2)
+    for key in ('a', 'b', 'c'):
+        first.put(key, key.encode())
+
+    second = cache.SQLiteBackend(path, 2)
+    assert (second.get('a'), second.get('b'), second.get('c')) == (None, b"b", b"c")
+
+
+def test_repeated_queries_are_embedded_once_and_counted(monkeypatch, caplog):
+    calls = []
+
+    def invoke(text, with_bits):
+        calls.append(text)
+        return np.ones(4, dtype=np.float32), None
+
+    monkeypatch.setattr(chat_app, 'invoke_embedding_model', invoke)
+    monkeypatch.setattr(chat_app, '_embedding_cache', cache.TieredCache('embedding', 4))
+    chat_app.app.log.addHandler(caplog.handler)
+    try:
+        chat_app.embed_text("Which projects use Python?")
+        chat_app.embed_text("which projects  use python?")
+    finally:
+        chat_app.app.log.removeHandler(caplog.handler)
+
+    assert calls == ["Which projects use Python?"]
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages[0].startswith("Embedding cache miss") and messages[1].startswith("Embedding cache hit")
+    assert "L1 1/2 hits (50%)" in messages[1]
+
+
+def test_response_key_changes_with_prompt_and_retrieval(monkeypatch):
+    key = chat_app.response_cache_key("Which projects use Python?", 'v1')
+
+    assert chat_app.response_cache_key("which projects use  python?", 'v1') == key
+    assert chat_app.response_cache_key("Which projects use Python?", 'v2') != key
+    for name, value in (('SYSTEM_PROMPT', "Answer in French."), ('RETRIEVAL_MODE', 'vector'),
+                        ('SEARCH_MODE', 'hnsw'), ('MODEL_ID', 'other-model')):
+        with monkeypatch.context() as patch:
+            patch.setattr(chat_app, name, value)
+            assert chat_app.response_cache_key("Which projects use Python?", 'v1') != key, name
+
+
+def unit(*values):
+    vec = np.array(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def test_semantic_cache_reuses_answers_for_near_identical_questions():
+    semantic = cache.SemanticCache(4, 60, 0.95)
+    semantic.put(unit(1, 0, 0), "answer", 'v1')
+
+    answer, similarity = semantic.get(unit(1, 0.1, 0), 'v1')
+    assert answer == "answer" and similarity > 0.99
+    assert semantic.get(unit(1, 1, 0), 'v1') is None
+    # A rebuilt store invalidates every answer
+    assert semantic.get(unit(1, 0, 0), 'v2') is None
+    assert (semantic.hits, semantic.misses) == (1, 2)
+
+
+def test_semantic_cache_expires_and_replaces_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    semantic = cache.SemanticCache(2, 60, 0.95)
+    semantic.put(unit(1, 0, 0), "x", 'v1')
+    semantic.put(unit(0, 1, 0), "y", 'v1')
+    now[0] += 1
+    semantic.get(unit(1, 0, 0), 'v1')
+    semantic.put(unit(0, 0, 1), "z", 'v1')
+
+    assert semantic.get(unit(0, 1, 0), 'v1') is None
+    assert semantic.get(unit(1, 0, 0), 'v1')[0] == "x"
+    now[0] += 61
+    assert semantic.get(unit(0, 0, 1), 'v1') is None
+
@@ -0,0 +1,98 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import app as chat_app
+from chalicelib import cache, lexical, vector_store
+
+CHUNKS = [
+    "Built a Chalice API on AWS Lambda",
+    "Wrote Python scripts for data pipelines",
+    "Enjoys rock climbing and photography",
+]
+
+
+def embedding(text):
+    """Deterministic unit vector per text. Texts made of the same characters
+    in another order embed identically, standing in for paraphrases."""
+    seed = sum(text.encode("utf-8"))
+    vec = np.random.default_rng(seed).standard_normal(chat_app.EMBEDDING_DIMENSIONS).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+@pytest.fixture
+def titan_calls(tmp_path, monkeypatch):
+    path = str(tmp_path / "vector_store.db")
+    conn = sqlite3.connect(path)
+    vector_store.create_schema(conn)
+    vector_store.write_meta(conn, embedding_model=chat_app.EMBEDDING_MODEL_ID,
+                            dimensions=chat_app.EMBEDDING_DIMENSIONS, normalized=1)
+    conn.executemany(
+        "INSERT INTO embeddings (id, source, chunk_text, embedding) VALUES (?, ?, ?, ?)",
+        [(i + 1, 'resume', text, vector_store.encode_vector(embedding(text))) for i, text in enumerate(CHUNKS)]
+    )
+    lexical.create_index(conn)
+    conn.commit()
+    conn.close()
+    store = chat_app.Store(path, 'v1', 'v1', (), {})
+
+    calls = []
+
+    def invoke(text, with_bits):
+        calls.append(text)
+        return embedding(text), None
+
+    monkeypatch.setattr(chat_app, 'get_db', lambda: chat_app.connect_store(store))
+    monkeypatch.setattr(chat_app, 'invoke_embedding_model', invoke)
+    monkeypatch.setattr(chat_app, '_index', None)
+    monkeypatch.setattr(chat_app, 'RETRIEVAL_MODE', 'hybrid')
+    monkeypatch.setattr(chat_app, 'SEMANTIC_CACHE_SIZE', 4)
+    monkeypatch.setattr(chat_app, '_embedding_cache', cache.TieredCache('embedding', 16))
+    monkeypatch.setattr(chat_app, '_response_cache', cache.TieredCache('response', 16))
+    monkeypatch.setattr(chat_app, '_semantic_cache', cache.SemanticCache(4, 60, 0.95))
+    return calls
+
+
+def test_keyword_query_is_answered_without_calling_titan(titan_calls):
+    cached, prompt = chat_app.prepare_chat("Chalice Lambda")
+
+    assert cached is None and prompt.query_vec is None
+    assert CHUNKS[0] in prompt.full_message
+    assert titan_calls == []
+
+
+def test_question_is_embedded_once_for_semantic_cache_and_retrieval(titan_calls):
+    question = "What did Eliot build on AWS Lambda?"
+    cached, prompt = chat_app.prepare_chat(question)
+    assert cached is None and titan_calls == [question]
+    chat_app.remember_answer(prompt, "A Chalice API.")
+
+    # The response cache answers the same question without embedding it
+    assert chat_app.prepare_chat(question.upper() + " ") == ("A Chalice API.", None)
+    assert titan_calls == [question]
+    # The semantic cache answers a paraphrase, embedded only to look it up
+    paraphrase = "What did Eliot build on Lambda AWS?"
+    assert chat_app.prepare_chat(paraphrase) == ("A Chalice API.", None)
+    assert titan_calls == [question, paraphrase]
+
+
+def test_session_follow_up_reuses_context_and_skips_answer_caches(titan_calls, monkeypatch):
+    monkeypatch.setattr(chat_app, '_sessions', chat_app.SessionStore(cache.MemoryBackend(16), 60))
+    question = "What did Eliot build on AWS Lambda?"
+    session = chat_app.load_session({'session': True})
+    _, prompt = chat_app.prepare_chat(question, session)
+    chat_app.remember_answer(prompt, "A Chalice API.")
+
+    def no_retrieval(conn, query, top_k=None):
+        raise AssertionError("an on-topic follow-up should reuse the session's context")
+
+    monkeypatch.setattr(chat_app, 'retrieve', no_retrieval)
+    session = chat_app.load_session({'session_id': session.id})
+    cached, prompt = chat_app.prepare_chat(question, session)
+
+    # Not the cached answer: it would ignore the turn before
+    assert cached is None
+    assert CHUNKS[0] in prompt.full_message
+    messages = chat_app.converse_request(prompt)['messages']
+    assert [message['content'][0]['text'] for message in messages[:2]] == [question, "A Chalice API."]
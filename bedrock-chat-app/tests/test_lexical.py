@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from chalicelib import lexical, vector_store
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    vector_store.create_schema(conn)
+    conn.executemany(
+        "INSERT INTO embeddings (id, source, chunk_text, embedding) VALUES (?, ?, ?, NULL)",
+        [
+            (1, 'resume', "Built a Chalice API on AWS Lambda with Python"),
+            (2, 'projects', "Python scripts, Python notebooks and more Python"),
+            (3, 'hobbies', "Rock climbing and photography"),
+        ]
+    )
+    lexical.create_index(conn)
+    yield conn
+    conn.close()
+
+
+def test_bm25_ranks_matching_chunks_best_first(conn):
+    hits = lexical.search(conn, "python", 10)
+
+    assert [chunk_id for chunk_id, _ in hits] == [2, 1]
+    assert hits[0][1] > hits[1][1] > 0
+    assert lexical.available(vector_store.read_meta(conn))
+
+
+def test_user_input_is_never_fts5_syntax(conn):
+    assert [chunk_id for chunk_id, _ in lexical.search(conn, 'climbing" OR NEAR(lambda *', 10)] == [3, 1]
+    assert lexical.search(conn, "?!", 10) == []
+
+
+def test_keyword_queries_are_short():
+    assert lexical.is_keyword_query("Chalice", 3)
+    assert lexical.is_keyword_query("AWS Lambda Python", 3)
+    assert not lexical.is_keyword_query("What has Eliot built with Python?", 3)
+    assert not lexical.is_keyword_query("...", 3)
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = lexical.reciprocal_rank_fusion([[1, 2, 3], [2, 4, 1]], k=60)
+
+    # 4 ranks above 1 in one list, but 1 appears in both
+    assert [chunk_id for chunk_id, _ in fused] == [2, 1, 4, 3]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pytest
+
+from chalicelib import vector_store
+from chalicelib.quantization import QuantizedMatrix
+from chalicelib.vector_index import VectorIndex, normalize_rows
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import build_vectors  # noqa: E402
+
+DIMENSIONS = 32
+
+
+def unit_rows(count, seed=0):
+    return normalize_rows(np.random.default_rng(seed).standard_normal((count, DIMENSIONS)).astype(np.float32))
+
+
+def write_store(path, matrix):
+    conn = sqlite3.connect(path)
+    vector_store.create_schema(conn)
+    vector_store.write_meta(conn, embedding_model='test', dimensions=DIMENSIONS, normalized=1)
+    conn.executemany(
+        "INSERT INTO embeddings (id, source, chunk_text, embedding) VALUES (?, ?, ?, ?)",
+        [(i + 1, 'doc', f"chunk {i}", vector_store.encode_vector(vec)) for i, vec in enumerate(matrix)]
+    )
+    conn.commit()
+    return conn
+
+
+@pytest.mark.parametrize("mode", ['int8', 'float16'])
+def test_scores_match_the_dequantized_matrix(mode):
+    matrix = unit_rows(300)
+    codes = QuantizedMatrix.quantize(matrix, mode)
+    query = matrix[7]
+
+    # Rows span more than one scoring block
+    assert np.allclose(codes @ query, codes[np.arange(len(matrix))] @ query, atol=1e-5)
+    assert np.abs(codes @ query - matrix @ query).max() < 0.02
+
+
+@pytest.mark.parametrize("mode, embedding_dtype", [('int8', 'float16'), ('float16', 'none')])
+def test_quantized_store_ships_less_and_finds_the_same_chunks(tmp_path, monkeypatch, mode, embedding_dtype):
+    matrix = unit_rows(300)
+    conn = write_store(str(tmp_path / "vector_store.db"), matrix)
+    monkeypatch.setattr(build_vectors, 'QUANTIZATION', mode)
+    build_vectors.build_quantization(conn)
+
+    meta = vector_store.read_meta(conn)
+    assert (meta['quantization'], meta['embedding_dtype']) == (mode, embedding_dtype)
+    stored = conn.execute("SELECT SUM(LENGTH(embedding)) FROM embeddings").fetchone()[0]
+    assert stored == (len(matrix) * DIMENSIONS * 2 if mode == 'int8' else None)
+
+    index = VectorIndex.load(conn, 'v1')
+    assert index.quantized
+    for row in (3, 150, 299):
+        ids, _ = index.search(matrix[row], 5, conn=conn, rescore=20)
+        exact = np.argsort(-(matrix @ matrix[row]))[:5] + 1
+        assert ids[0] == row + 1
+        assert set(ids.tolist()) == set(exact.tolist())
+    conn.close()
@@ -0,0 +1,112 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from chalicelib import lexical, segments, vector_store
+from chalicelib.vector_index import VectorIndex
+
+DIMENSIONS = 4
+
+
+def unit(i):
+    vec = np.zeros(DIMENSIONS, dtype=np.float32)
+    vec[i] = 1
+    return vec
+
+
+def write_store(path, chunks, tombstones=None, fts=True):
+    """chunks is [(id, source, text, vector)]; tombstones makes it a delta."""
+    conn = sqlite3.connect(path)
+    vector_store.create_schema(conn)
+    vector_store.write_meta(conn, embedding_model='test', dimensions=DIMENSIONS, normalized=1)
+    if tombstones is not None:
+        segments.create_tables(conn)
+        segments.write_tombstones(conn, tombstones)
+    conn.executemany(
+        "INSERT INTO embeddings (id, source, chunk_text, embedding) VALUES (?, ?, ?, ?)",
+        [(chunk_id, source, text, vector_store.encode_vector(vec)) for chunk_id, source, text, vec in chunks]
+    )
+    if fts:
+        lexical.create_index(conn)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A base with sources a and b, a delta replacing a and adding c, and a
+    second delta replacing c; only chunks 3, 4 and 6 are live."""
+    base_path = write_store(tmp_path / "base.db", [
+        (1, 'a', "python scripts", unit(0)),
+        (2, 'a', "old resume", unit(1)),
+        (3, 'b', "chalice lambda", unit(2)),
+    ])
+    first = write_store(tmp_path / "delta-1.db", [
+        (4, 'a', "python projects", unit(0)),
+        (5, 'c', "python tutoring", unit(3)),
+    ], tombstones=['a'])
+    second = write_store(tmp_path / "delta-2.db", [
+        (6, 'c', "teaching", unit(3)),
+    ], tombstones=['c'])
+    conn = sqlite3.connect(base_path)
+    base = VectorIndex.load(conn, 'base', search_mode='exact')
+    deltas = [segments.Delta.load(first), segments.Delta.load(second)]
+    yield conn, segments.SegmentedIndex('v2', base, deltas)
+    conn.close()
+
+
+def test_live_masks_apply_tombstones_from_later_segments_only(tmp_path):
+    first = segments.Delta.load(write_store(tmp_path / "d1.db", [(4, 'a', "x", unit(0)), (5, 'c', "y", unit(1))],
+                                            tombstones=['a']))
+    second = segments.Delta.load(write_store(tmp_path / "d2.db", [(6, 'c', "z", unit(1))], tombstones=['c']))
+
+    base_mask, delta_masks = segments.live_masks(np.array(['a', 'a', 'b'], dtype=object), [first, second])
+
+    assert base_mask.tolist() == [False, False, True]
+    assert [mask.tolist() for mask in delta_masks] == [[True, False], [True]]
+
+
+def test_search_drops_tombstoned_chunks_and_merges_deltas(store):
+    conn, index = store
+
+    ids, scores = index.search(unit(0), 10)
+
+    assert len(index) == 3
+    assert index.deleted_ids == {1, 2}
+    assert ids[0] == 4 and scores[0] == pytest.approx(1.0)
+    assert sorted(ids.tolist()) == [3, 4, 6]
+
+
+def test_fetch_chunks_reads_base_and_delta_chunks(store):
+    conn, index = store
+
+    assert index.fetch_chunks(conn, [3, 4, 6]) == {
+        3: ('b', "chalice lambda"),
+        4: ('a', "python projects"),
+        6: ('c', "teaching"),
+    }
+
+
+def test_lexical_search_merges_live_delta_hits(store):
+    conn, index = store
+
+    hits = index.lexical_search(conn, "python", 10)
+
+    # 1 is tombstoned in the base and 5 by the second delta
+    assert [chunk_id for chunk_id, _ in hits] == [4]
+
+
+def test_lexical_search_skips_deltas_without_fts(tmp_path):
+    base_path = write_store(tmp_path / "base.db", [(1, 'a', "python", unit(0))])
+    delta_path = write_store(tmp_path / "delta.db", [(2, 'b', "python", unit(1))], tombstones=[], fts=False)
+    conn = sqlite3.connect(base_path)
+    try:
+        base = VectorIndex.load(conn, 'base', search_mode='exact')
+        index = segments.SegmentedIndex('v1', base, [segments.Delta.load(delta_path)])
+
+        assert [chunk_id for chunk_id, _ in index.lexical_search(conn, "python", 10)] == [1]
+        assert sorted(index.search(unit(1), 10)[0].tolist()) == [1, 2]
+    finally:
+        conn.close()
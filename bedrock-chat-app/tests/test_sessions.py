@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from chalice import BadRequestError
+
+import app as chat_app
+from chalicelib import cache
+from chalicelib.sessions import Session, SessionStore, trim_turns
+
+
+class FailingBackend:
+    def get(self, key):
+        raise ConnectionError("table unavailable")
+
+    def put(self, key, value, ttl_seconds=None):
+        raise ConnectionError("table unavailable")
+
+
+def turn(user, assistant):
+    return {'user': user, 'assistant': assistant}
+
+
+def test_history_keeps_the_most_recent_turns_within_budget():
+    turns = [turn("a" * 40, "b" * 40), turn("c" * 8, "d" * 8), turn("e" * 4, "f" * 4)]
+
+    # 20 + 4 + 2 estimated tokens
+    assert trim_turns(turns, 6) == turns[1:]
+    assert trim_turns(turns, 26) == turns
+    assert trim_turns(turns, 1) == []
+    session = Session("s", turns[1:])
+    assert [message['role'] for message in session.history(6)] == ['user', 'assistant'] * 2
+
+
+def test_sessions_round_trip_through_the_backend():
+    store = SessionStore(cache.MemoryBackend(16), 60)
+    session = store.load()
+    session.add_turn("Which projects use Python?", "Two of them.", 100)
+    session.context = [('resume', "Python scripts")]
+    session.topic = np.array([0.6, 0.8], dtype=np.float32)
+    session.store_version = 'v1'
+    store.save(session)
+
+    loaded = store.load(session.id)
+    assert loaded.turns == session.turns and loaded.context == session.context
+    assert loaded.on_topic(np.array([0.6, 0.8], dtype=np.float32), 'v1', 0.9)
+    assert not loaded.on_topic(np.array([1, 0], dtype=np.float32), 'v1', 0.9)
+    assert not loaded.on_topic(np.array([0.6, 0.8], dtype=np.float32), 'v2', 0.9)
+
+
+def test_unknown_ids_are_replaced_by_minted_ones():
+    store = SessionStore(cache.MemoryBackend(16), 60)
+
+    session = store.load("chosen-by-client")
+    assert session.id != "chosen-by-client" and session.turns == []
+    assert SessionStore(FailingBackend(), 60).load("any").turns == []
+
+
+def test_sessions_are_created_only_on_request(monkeypatch):
+    monkeypatch.setattr(chat_app, '_sessions', SessionStore(cache.MemoryBackend(16), 60))
+
+    assert chat_app.load_session({'message': "hi"}) is None
+    assert chat_app.load_session({'message': "hi", 'session': True}) is not None
+    with pytest.raises(BadRequestError):
+        chat_app.load_session({'message': "hi", 'session_id': 5})
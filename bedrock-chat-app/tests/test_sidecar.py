@@ -0,0 +1,58 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from chalicelib import vector_store
+from chalicelib.vector_index import VectorIndex, normalize_rows
+
+DIMENSIONS = 16
+
+
+def write_store(tmp_path, matrix):
+    conn = sqlite3.connect(str(tmp_path / "vector_store.db"))
+    vector_store.create_schema(conn)
+    vector_store.write_meta(conn, embedding_model='test', dimensions=DIMENSIONS, normalized=1)
+    conn.executemany(
+        "INSERT INTO embeddings (id, source, chunk_text, embedding) VALUES (?, ?, ?, ?)",
+        [(i + 1, 'doc', f"chunk {i}", vector_store.encode_vector(vec)) for i, vec in enumerate(matrix)]
+    )
+    vector_store.write_sidecar(conn, matrix, str(tmp_path / "vectors.npy"))
+    conn.commit()
+    return conn
+
+
+@pytest.fixture
+def matrix():
+    return normalize_rows(np.random.default_rng(0).standard_normal((50, DIMENSIONS)).astype(np.float32))
+
+
+def test_vectors_move_to_a_memory_mapped_sidecar(tmp_path, matrix):
+    conn = write_store(tmp_path, matrix)
+
+    assert conn.execute("SELECT COUNT(*) FROM embeddings WHERE embedding IS NOT NULL").fetchone()[0] == 0
+    index = VectorIndex.load(conn, 'v1', search_mode='exact')
+    assert not index.matrix.flags.owndata
+    assert np.array_equal(index.matrix, matrix)
+    ids, _ = index.search(matrix[9], 3)
+    assert ids[0] == 10
+    conn.close()
+
+
+def test_sidecar_with_the_wrong_row_count_is_corrupt(tmp_path, matrix):
+    conn = write_store(tmp_path, matrix)
+    np.save(str(tmp_path / "vectors.npy"), matrix[:-1])
+
+    with pytest.raises(vector_store.CorruptStoreError):
+        VectorIndex.load(conn, 'v1')
+    conn.close()
+
+
+def test_missing_sidecar_is_corrupt(tmp_path, matrix):
+    conn = write_store(tmp_path, matrix)
+    os.remove(str(tmp_path / "vectors.npy"))
+
+    with pytest.raises(vector_store.CorruptStoreError):
+        VectorIndex.load(conn, 'v1')
+    conn.close()
@@ -0,0 +1,38 @@
+import time
+
+import app as chat_app
+
+
+def failing_refresh(current):
+    raise ConnectionError("S3 unreachable")
+
+
+def test_failed_refresh_keeps_store_and_is_logged(monkeypatch, caplog):
+    store = chat_app.Store('/tmp/stores/v1/vector_store.db', 'v1', 'v1', (), {})
+    checked_at = time.monotonic() - 2 * chat_app.STORE_CHECK_INTERVAL
+    monkeypatch.setattr(chat_app, '_store', store)
+    monkeypatch.setattr(chat_app, '_store_checked_at', checked_at)
+    monkeypatch.setattr(chat_app, 'refresh_store', failing_refresh)
+    chat_app.app.log.addHandler(caplog.handler)
+    try:
+        chat_app.refresh()
+    finally:
+        chat_app.app.log.removeHandler(caplog.handler)
+
+    assert chat_app._store is store
+    # Still due, so the next request retries
+    assert chat_app._store_checked_at == checked_at and not chat_app.store_is_fresh()
+    [record] = caplog.records
+    assert record.levelname == 'WARNING'
+    assert "serving version v1 (last checked" in record.getMessage()
+
+
+def test_fresh_store_is_not_checked_again(monkeypatch):
+    store = chat_app.Store('/tmp/stores/v1/vector_store.db', 'v1', 'v1', (), {})
+    monkeypatch.setattr(chat_app, '_store', store)
+    monkeypatch.setattr(chat_app, '_store_checked_at', time.monotonic())
+    monkeypatch.setattr(chat_app, 'refresh_store', failing_refresh)
+
+    chat_app.refresh()
+
+    assert chat_app._store is store and chat_app.store_is_fresh()
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+import app as chat_app
+from chalicelib import cache
+
+CONNECTION_ID = "connection"
+
+
+class StubStream:
+    """Three reasoning deltas, then one text delta per word."""
+
+    def __init__(self, words, on_text=None):
+        self.words = words
+        self.on_text = on_text
+        self.closed = False
+
+    def __iter__(self):
+        for _ in range(3):
+            yield {'contentBlockDelta': {'delta': {'reasoningContent': {'text': "..."}}}}
+        for i, word in enumerate(self.words):
+            yield {'contentBlockDelta': {'delta': {'text': word + " "}}}
+            if self.on_text is not None:
+                self.on_text(i + 1)
+        yield {'messageStop': {'stopReason': 'end_turn'}}
+
+    def close(self):
+        self.closed = True
+
+
+class StubBedrock:
+    def __init__(self, on_text=None):
+        self.on_text = on_text
+        self.streams = []
+
+    def converse_stream(self, **request):
+        self.streams.append(StubStream(["one", "two", "three", "four"], self.on_text))
+        return {'stream': self.streams[-1]}
+
+
+def ws_event(route_key, body=None):
+    """The event API Gateway invokes the handlers with."""
+    return {
+        'requestContext': {
+            'routeKey': route_key,
+            'connectionId': CONNECTION_ID,
+            'apiId': "api",
+            'stage': "test",
+            'domainName': "localhost",
+        },
+        'body': json.dumps(body) if body is not None else None,
+    }
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    replies = []
+    monkeypatch.setattr(chat_app, '_cancel_flags', cache.TieredCache('cancel', 16, backend=cache.MemoryBackend(16)))
+    monkeypatch.setattr(chat_app, 'WS_CANCEL_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(chat_app, 'ws_send', lambda connection_id, request_id, payload: replies.append(
+        dict(payload, id=request_id)))
+    monkeypatch.setattr(chat_app, 'prepare_chat', lambda message, session: (
+        None, chat_app.Prompt(message, None, None, 'v1', message, session)))
+    return replies
+
+
+def use_bedrock(monkeypatch, bedrock):
+    monkeypatch.setattr(chat_app.boto3, 'client', lambda **kwargs: bedrock)
+
+
+def chat(request_id):
+    chat_app.ws_message(ws_event('$default', {'action': 'chat', 'id': request_id, 'message': "hello"}), None)
+
+
+def cancel(request_id):
+    chat_app.ws_message(ws_event('$default', {'action': 'cancel', 'id': request_id}), None)
+
+
+def types(replies):
+    return [reply['type'] for reply in replies]
+
+
+def test_answer_streams_then_finishes(monkeypatch, sent):
+    use_bedrock(monkeypatch, StubBedrock())
+
+    chat("q1")
+
+    assert types(sent) == ['text'] * 4 + ['done']
+    assert "".join(reply['text'] for reply in sent[:4]) == "one two three four "
+    assert all(reply['id'] == "q1" for reply in sent)
+
+
+def test_cancel_stops_the_stream(monkeypatch, sent):
+    bedrock = StubBedrock(on_text=lambda count: cancel("q1") if count == 2 else None)
+    use_bedrock(monkeypatch, bedrock)
+
+    chat("q1")
+
+    assert types(sent) == ['text', 'text', 'cancelled']
+    assert bedrock.streams[0].closed
+
+
+def test_cancel_sent_before_the_chat_still_stops_it(monkeypatch, sent):
+    use_bedrock(monkeypatch, StubBedrock())
+    cancel("q1")
+
+    chat("q1")
+
+    assert types(sent) == ['cancelled']
+
+
+def test_finished_chat_id_can_be_reused(monkeypatch, sent):
+    use_bedrock(monkeypatch, StubBedrock(on_text=lambda count: cancel("q1") if count == 1 else None))
+    chat("q1")
+    assert types(sent)[-1] == 'cancelled'
+
+    use_bedrock(monkeypatch, StubBedrock())
+    del sent[:]
+    chat("q1")
+
+    assert types(sent) == ['text'] * 4 + ['done']
+
+
+def test_disconnect_stops_every_chat_on_the_connection(monkeypatch, sent):
+    bedrock = StubBedrock(on_text=lambda count: chat_app.ws_disconnect(ws_event('$disconnect'), None) if count == 1 else None)
+    use_bedrock(monkeypatch, bedrock)
+
+    chat("q1")
+
+    assert types(sent) == ['text', 'cancelled']
+    assert bedrock.streams[0].closed
+
+
+def test_cancel_without_id_is_rejected(sent):
+    chat_app.ws_message(ws_event('$default', {'action': 'cancel'}), None)
+
+    assert sent == [{'type': 'error', 'message': "Cancel requires the id of the chat", 'id': None}]
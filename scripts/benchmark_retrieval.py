@@ -0,0 +1,142 @@
+"""
+Recall and latency of the approximate search modes against exact retrieve().
+
+Queries are stored vectors with a little Gaussian noise added, so the
+benchmark runs offline without calling Titan:
+
+    python scripts/benchmark_retrieval.py --db vector_store.db
+    python scripts/benchmark_retrieval.py --synthetic 20000 --nlist 128 --m 16
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bedrock-chat-app"))
+from chalicelib import binary, ivf, quantization, scoring  # noqa: E402
+from chalicelib.hnsw import HNSWGraph  # noqa: E402
+from chalicelib.quantization import QuantizedMatrix  # noqa: E402
+from chalicelib.vector_index import VectorIndex, normalize_rows  # noqa: E402
+
+
+def synthetic_index(count, dim, seed=0):
+    # Clustered unit vectors look more like real embeddings than uniform noise.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(count // 100, 1), dim))
+    matrix = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.standard_normal((count, dim))
+    matrix = normalize_rows(matrix).astype(np.float32)
+    ids = np.arange(1, count + 1, dtype=np.int64)
+    return VectorIndex("synthetic", ids, np.full(count, "synthetic", dtype=object), matrix, {})
+
+
+def make_queries(matrix, count, noise, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.integers(len(matrix), size=count)]
+    queries = queries + noise * rng.standard_normal(queries.shape) / np.sqrt(matrix.shape[1])
+    return normalize_rows(queries).astype(np.float32)
+
+
+def run(name, search, queries, truth, k):
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(rows[:k].tolist()) & expected)
+    latencies = np.array(latencies)
+    print(f"{name:<28} recall@{k} {hits / (len(queries) * k):6.3f}   "
+          f"p50 {np.percentile(latencies, 50):8.3f} ms   p95 {np.percentile(latencies, 95):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default="vector_store.db", help="vector store to benchmark")
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark N synthetic vectors instead of --db")
+    parser.add_argument("--dim", type=int, default=1024, help="dimensions of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.3, help="query perturbation relative to a unit vector")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=0, help="train IVF lists when the store has none")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--m", type=int, default=0, help="build an HNSW graph when the store has none")
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--quantize", nargs="*", default=[], choices=quantization.MODES,
+                        help="also benchmark exact search over quantized codes")
+    parser.add_argument("--rescore", type=int, default=50, help="shortlist reranked at full precision")
+    parser.add_argument("--dimensions", type=int, nargs="*", default=[],
+                        help="benchmark exact search at these reduced dimensions")
+    parser.add_argument("--binary-candidates", type=int, nargs="*", default=[],
+                        help="benchmark Hamming prefilter + rerank with these shortlist sizes")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        index = synthetic_index(args.synthetic, args.dim)
+    else:
+        conn = sqlite3.connect(args.db)
+        index = VectorIndex.load(conn, args.db, use_codes=False)
+        conn.close()
+    print(f"{len(index)} vectors x {index.matrix.shape[1]} dims, {args.queries} queries")
+
+    if index.ivf_lists is None and args.nlist:
+        start = time.perf_counter()
+        index.ivf_lists = ivf.IVFLists.train(index.matrix, args.nlist)
+        print(f"Trained {args.nlist} IVF lists in {time.perf_counter() - start:.1f}s")
+    if index.hnsw_graph is None and args.m:
+        start = time.perf_counter()
+        index.hnsw_graph = HNSWGraph.build(index.matrix, m=args.m, ef_construction=args.ef_construction)
+        print(f"Built HNSW graph (M={args.m}) in {time.perf_counter() - start:.1f}s")
+
+    queries = make_queries(index.matrix, args.queries, args.noise)
+    truth = [set(scoring.top_k(index.matrix, q, args.k)[0].tolist()) for q in queries]
+
+    print()
+    run("exact", lambda q: index.search_rows(q, args.k, "exact", 0, 0)[0], queries, truth, args.k)
+    if index.ivf_lists is not None:
+        for nprobe in args.nprobe:
+            run(f"ivf nlist={index.ivf_lists.nlist} nprobe={nprobe}",
+                lambda q: index.search_rows(q, args.k, "ivf", nprobe, 0)[0], queries, truth, args.k)
+    if index.hnsw_graph is not None:
+        for ef_search in args.ef_search:
+            run(f"hnsw M={index.hnsw_graph.m} ef_search={ef_search}",
+                lambda q: index.search_rows(q, args.k, "hnsw", 0, ef_search)[0], queries, truth, args.k)
+
+    for dimensions in args.dimensions:
+        # Approximates a store built with a smaller Titan "dimensions" setting
+        # by keeping the leading dimensions and renormalizing; recall is
+        # measured against exact search at full size.
+        reduced = normalize_rows(index.matrix[:, :dimensions]).astype(np.float32)
+        reduced_queries = normalize_rows(queries[:, :dimensions]).astype(np.float32)
+        print(f"\n{dimensions} dims: {reduced.nbytes / 1e6:.2f} MB float32")
+        run(f"exact dims={dimensions}", lambda q: scoring.top_k(reduced, q, args.k)[0],
+            reduced_queries, truth, args.k)
+
+    if args.binary_candidates:
+        # Titan's binary embedding is the sign of each dimension, so stores
+        # built without bits can be benchmarked from their float vectors.
+        if index.bit_matrix is None:
+            index.bit_matrix = np.packbits(index.matrix > 0, axis=1)
+        print(f"\nbinary: {index.bit_matrix.nbytes / 1e6:.2f} MB packed bits")
+        for candidates in args.binary_candidates:
+            run(f"binary candidates={candidates}",
+                lambda q: index.search_rows(q, args.k, "binary", 0, 0, binary.pack(q > 0), candidates)[0],
+                queries, truth, args.k)
+
+    for mode in args.quantize:
+        codes = QuantizedMatrix.quantize(index.matrix, mode)
+        print(f"\n{mode}: {index.matrix.nbytes / 1e6:.2f} MB float32 -> {codes.nbytes / 1e6:.2f} MB codes")
+        run(f"exact {mode}", lambda q: scoring.top_k(codes, q, args.k)[0], queries, truth, args.k)
+
+        def rescored(q):
+            rows = scoring.top_k(codes, q, max(args.k, args.rescore))[0]
+            return quantization.rescore(q, rows, index.matrix[rows], args.k)[0]
+        run(f"exact {mode} rescore={args.rescore}", rescored, queries, truth, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,75 @@
+import argparse
+import hashlib
 import sqlite3
 import json
 import boto3
 import numpy as np
 import os
+import shutil
+import sys
+import tempfile
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bedrock-chat-app"))
+from chalicelib import artifact, binary, ivf, lexical, segments, shards, vector_store  # noqa: E402
+from chalicelib.hnsw import HNSWGraph  # noqa: E402
+from chalicelib.quantization import QuantizedMatrix  # noqa: E402
+from chalicelib.vector_index import VectorIndex  # noqa: E402
 
 S3_BUCKET = "vector-bucket-eliot-pitman"
 REGION = "us-east-1"
 DB_PATH = "vector_store.db"
+VECTORS_PATH = "vectors.npy"
+DELTA_PATH = "delta.db"
+SHARDS_DIR = "shards"
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+# 256, 512 or 1024; the Lambda's EMBEDDING_DIMENSIONS must match
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "1024"))
 KNOWLEDGE_BASE_DIR = "knowledge_base"
+# Number of k-means lists for the IVF index; 0 skips building it
+IVF_NLIST = int(os.environ.get("IVF_NLIST", "0"))
+# HNSW graph degree (M); 0 skips building the graph
+HNSW_M = int(os.environ.get("HNSW_M", "0"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", "100"))
+# Compressed codes the Lambda scores against: "int8", "float16" or "" for none
+QUANTIZATION = os.environ.get("QUANTIZATION", "")
+# Also store Titan's binary embeddings, packed to bits, for Hamming prefiltering
+BINARY_EMBEDDINGS = os.environ.get("BINARY_EMBEDDINGS", "0") == "1"
+# Ship float vectors as a memory-mappable vectors.npy instead of SQLite BLOBs
+VECTOR_SIDECAR = os.environ.get("VECTOR_SIDECAR", "0") == "1"
+# Split the store into this many k-means clusters, each uploaded as its own
+# shard that the Lambda fetches on demand; 0 keeps a single store file
+SHARDS = int(os.environ.get("SHARDS", "0"))
+# Compression of the uploaded files: "gzip", "zstd" (needs zstandard) or "none"
+COMPRESSION = os.environ.get("COMPRESSION", "gzip")
+# Delta segments published before `delta` compacts them into a new base
+COMPACT_AFTER = int(os.environ.get("COMPACT_AFTER", "8"))
+# Also copy the uploaded store into the Chalice package as the baseline the
+# Lambda serves on cold start (deploy afterwards to ship it)
+BASELINE = os.environ.get("BASELINE", "0") == "1"
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bedrock-chat-app", "chalicelib", "baseline")
 
 bedrock = boto3.client("bedrock-runtime", region_name=REGION)
 
 def embed(text):
+    """Return (unit float32 vector, packed binary embedding or None)."""
+    request = {"inputText": text, "dimensions": EMBEDDING_DIMENSIONS, "normalize": True}
+    if BINARY_EMBEDDINGS:
+        request["embeddingTypes"] = ["float", "binary"]
     response = bedrock.invoke_model(
-        modelId="amazon.titan-embed-text-v2:0",
-        body=json.dumps({"inputText": text})
+        modelId=EMBEDDING_MODEL_ID,
+        body=json.dumps(request)
     )
-    return json.loads(response["body"].read())["embedding"]
+    result = json.loads(response["body"].read())
+    if BINARY_EMBEDDINGS:
+        vec = result["embeddingsByType"]["float"]
+        bits = binary.pack(result["embeddingsByType"]["binary"])
+    else:
+        vec, bits = result["embedding"], None
+    vec = np.array(vec, dtype=np.float32)
+    # Titan already returns unit vectors; renormalize after the float32 cast so
+    # the runtime can score with a plain dot product.
+    return vec / np.linalg.norm(vec), bits
 
 def chunk_text(text, chunk_size=500, overlap=50):
     words = text.split()
@@ -27,54 +80,390 @@ def chunk_text(text, chunk_size=500, overlap=50):
             chunks.append(chunk)
     return chunks
 
-def build():
-    # Remove old db if exists
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        CREATE TABLE embeddings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source TEXT,
-            chunk_text TEXT,
-            embedding TEXT
+def build_ivf(conn):
+    index = VectorIndex.load(conn, None, search_mode='exact')
+    print(f"Training IVF index with {IVF_NLIST} lists over {len(index)} chunks...")
+    centroids, assignments = ivf.train_kmeans(index.matrix, IVF_NLIST)
+    ivf.write(conn, index.ids, centroids, assignments)
+    conn.commit()
+    print(f"  List sizes: min {np.bincount(assignments).min()}, max {np.bincount(assignments).max()}")
+
+def build_hnsw(conn):
+    index = VectorIndex.load(conn, None, search_mode='exact')
+    print(f"Building HNSW graph (M={HNSW_M}, ef_construction={HNSW_EF_CONSTRUCTION}) over {len(index)} chunks...")
+    graph = HNSWGraph.build(index.matrix, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+    graph.write(conn, index.ids)
+    conn.commit()
+    print(f"  {graph.max_level + 1} layers")
+
+def build_quantization(conn):
+    index = VectorIndex.load(conn, None, use_codes=False, search_mode='exact')
+    codes = QuantizedMatrix.quantize(index.matrix, QUANTIZATION)
+    codes.write(conn, index.ids)
+    # Shipping float32 vectors beside the codes would make the artifact
+    # bigger than without them; rescoring needs no more than float16
+    if QUANTIZATION == 'int8':
+        conn.executemany(
+            "UPDATE embeddings SET embedding = ? WHERE id = ?",
+            [(vector_store.encode_vector(vec, np.float16), int(chunk_id))
+             for chunk_id, vec in zip(index.ids, index.matrix)]
         )
-    """)
+        vector_store.write_meta(conn, embedding_dtype='float16')
+    else:
+        conn.execute("UPDATE embeddings SET embedding = NULL")
+        vector_store.write_meta(conn, embedding_dtype='none')
+    conn.commit()
+    conn.execute("VACUUM")
+    print(f"Quantized vectors to {QUANTIZATION}: {index.matrix.nbytes / 1e6:.1f} MB -> {codes.nbytes / 1e6:.1f} MB in memory")
 
-    files = [f for f in os.listdir(KNOWLEDGE_BASE_DIR) if f.endswith(".txt")]
-    
-    if not files:
-        print("No .txt files found in knowledge_base/")
-        return
+def build_sidecar(conn):
+    index = VectorIndex.load(conn, None, use_codes=False, search_mode='exact')
+    vector_store.write_sidecar(conn, index.matrix, VECTORS_PATH,
+                               vector_store.embedding_dtype(vector_store.read_meta(conn)))
+    conn.commit()
+    conn.execute("VACUUM")
+    print(f"Wrote {len(index)} vectors to {VECTORS_PATH} ({os.path.getsize(VECTORS_PATH) / 1e6:.1f} MB)")
+
+def build_shards(conn):
+    """Split the finished store into SHARDS k-means clusters, each written
+    to SHARDS_DIR as a store of its own, and rebuild DB_PATH as the routing
+    store over them. Chunk ids are renumbered so every shard holds one
+    contiguous range."""
+    index = VectorIndex.load(conn, None, use_codes=False, search_mode='exact')
+    texts = dict(conn.execute("SELECT id, chunk_text FROM embeddings").fetchall())
+    bits = read_bits(conn)
+    conn.close()
+    print(f"Clustering {len(index)} chunks into {SHARDS} shards...")
+    centroids, assignments = ivf.train_kmeans(index.matrix, SHARDS)
+
+    remove_outputs(DB_PATH)
+    shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    os.makedirs(SHARDS_DIR)
+    routing = create_store(DB_PATH)
+    routes = []
+    chunk_id = 1
+    for shard in range(len(centroids)):
+        rows = np.flatnonzero(assignments == shard)
+        if not len(rows):
+            continue
+        name = f"shard-{shard:04d}.db"
+        shard_conn = create_store(os.path.join(SHARDS_DIR, name))
+        first_id = chunk_id
+        for row in rows:
+            old_id = int(index.ids[row])
+            insert_chunk(shard_conn, chunk_id, index.sources[row], texts[old_id], index.matrix[row], bits.get(old_id))
+            routing.execute("INSERT INTO embeddings (id, source) VALUES (?, ?)", (chunk_id, index.sources[row]))
+            chunk_id += 1
+        shard_conn.commit()
+        shard_conn.close()
+        routes.append((name, first_id, chunk_id - 1, centroids[shard]))
+        print(f"  {name}: {len(rows)} chunks "
+              f"({os.path.getsize(os.path.join(SHARDS_DIR, name)) / 1e6:.1f} MB)")
+    shards.write(routing, routes)
+    routing.commit()
+    routing.close()
+
+def shard_paths():
+    return [os.path.join(SHARDS_DIR, name) for name in sorted(os.listdir(SHARDS_DIR)) if name.endswith(".db")]
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def upload(s3, sources, next_id):
+    # Store files go first and the manifest last: the Lambda polls the
+    # manifest and expects every file it lists to be there already.
+    shard_entries = {}
+    for path in shard_paths() if SHARDS else []:
+        # Shards, like segments, are named by content
+        key = f"shards/{file_sha256(path)[:16]}.db{artifact.SUFFIXES[COMPRESSION]}"
+        shard_entries[os.path.basename(path)] = upload_file(s3, path, key)
+    files = {}
+    for path in ([VECTORS_PATH] if VECTOR_SIDECAR else []) + [DB_PATH]:
+        # Also named by content: overwriting fixed keys would swap the files
+        # under a Lambda still downloading what the previous manifest lists
+        name, ext = os.path.splitext(os.path.basename(path))
+        key = f"store/{name}-{file_sha256(path)[:16]}{ext}{artifact.SUFFIXES[COMPRESSION]}"
+        files[os.path.basename(path)] = upload_file(s3, path, key)
+    upload_manifest(s3, files, (), sources, next_id, shard_entries)
 
-    for filename in files:
-        path = os.path.join(KNOWLEDGE_BASE_DIR, filename)
-        print(f"Processing {filename}...")
-        
-        with open(path, "r", encoding="utf-8") as f:
+def upload_file(s3, path, key):
+    """Compress and upload path under key; return its manifest entry."""
+    compressed_path, entry = artifact.compress(path, COMPRESSION)
+    entry['key'] = key
+    print(f"Uploading to s3://{S3_BUCKET}/{entry['key']} "
+          f"({entry['size'] / 1e6:.1f} MB -> {entry['stored_size'] / 1e6:.1f} MB) ...")
+    s3.upload_file(compressed_path, S3_BUCKET, entry['key'])
+    return entry
+
+def upload_manifest(s3, files, deltas, sources, next_id, shard_entries=None):
+    print(f"Uploading to s3://{S3_BUCKET}/{artifact.MANIFEST_KEY} ...")
+    body = artifact.write_manifest(files, deltas, sources, next_id, shard_entries)
+    s3.put_object(Bucket=S3_BUCKET, Key=artifact.MANIFEST_KEY, Body=body, ContentType="application/json")
+    return body
+
+def fetch_manifest(s3):
+    """The published manifest, or None if there is none a delta can build on."""
+    try:
+        body = s3.get_object(Bucket=S3_BUCKET, Key=artifact.MANIFEST_KEY)["Body"].read()
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    manifest = artifact.read_manifest(body)
+    return manifest if manifest['next_id'] is not None else None
+
+def build_baseline(s3):
+    # The version marker is the uploaded manifest's ETag, so the Lambda's first
+    # conditional GET finds S3 unchanged and downloads nothing
+    response = s3.get_object(Bucket=S3_BUCKET, Key=artifact.MANIFEST_KEY)
+    etag = response["ETag"]
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    for name in os.listdir(BASELINE_DIR):
+        os.remove(os.path.join(BASELINE_DIR, name))
+    shutil.copyfile(DB_PATH, os.path.join(BASELINE_DIR, "vector_store.db"))
+    if VECTOR_SIDECAR:
+        shutil.copyfile(VECTORS_PATH, os.path.join(BASELINE_DIR, VECTORS_PATH))
+    with open(os.path.join(BASELINE_DIR, artifact.MANIFEST_KEY), "wb") as f:
+        f.write(response["Body"].read())
+    with open(os.path.join(BASELINE_DIR, "VERSION"), "w") as f:
+        f.write(etag)
+    print(f"Copied baseline store version {etag} to {os.path.normpath(BASELINE_DIR)}")
+
+def read_sources():
+    """{file name: (text, SHA-256 of the text)} for the knowledge base."""
+    sources = {}
+    for filename in sorted(f for f in os.listdir(KNOWLEDGE_BASE_DIR) if f.endswith(".txt")):
+        with open(os.path.join(KNOWLEDGE_BASE_DIR, filename), "r", encoding="utf-8") as f:
             text = f.read()
+        sources[filename] = (text, hashlib.sha256(text.encode("utf-8")).hexdigest())
+    return sources
 
-        chunks = chunk_text(text)
-        print(f"  {len(chunks)} chunks found")
+def create_store(path):
+    conn = sqlite3.connect(path)
+    vector_store.create_schema(conn)
+    vector_store.write_meta(
+        conn, embedding_model=EMBEDDING_MODEL_ID, dimensions=EMBEDDING_DIMENSIONS, normalized=1
+    )
+    if BINARY_EMBEDDINGS:
+        binary.create_table(conn)
+        vector_store.write_meta(conn, binary=1)
+    return conn
 
-        for i, chunk in enumerate(chunks):
-            vec = embed(chunk)
-            conn.execute(
-                "INSERT INTO embeddings (source, chunk_text, embedding) VALUES (?, ?, ?)",
-                (filename, chunk, json.dumps(vec))
-            )
-            print(f"  Embedded chunk {i + 1}/{len(chunks)}")
+def remove_outputs(*paths):
+    # Remove old files and their compressed copies if they exist
+    for base in paths:
+        for path in {base + suffix for suffix in artifact.SUFFIXES.values()}:
+            if os.path.exists(path):
+                os.remove(path)
 
-        conn.commit()
+def insert_chunk(conn, chunk_id, source, text, vec, bits):
+    """Insert one chunk; a chunk_id of None lets SQLite assign the next id."""
+    cursor = conn.execute(
+        "INSERT INTO embeddings (id, source, chunk_text, embedding) VALUES (?, ?, ?, ?)",
+        (chunk_id, source, text, vector_store.encode_vector(vec))
+    )
+    if bits is not None:
+        binary.write(conn, cursor.lastrowid, bits)
+    return cursor.lastrowid
+
+def embed_source(conn, filename, text, next_id=None):
+    """Chunk and embed one file; return the id after its last chunk."""
+    print(f"Processing {filename}...")
+    chunks = chunk_text(text)
+    print(f"  {len(chunks)} chunks found")
+    for i, chunk in enumerate(chunks):
+        vec, bits = embed(chunk)
+        chunk_id = insert_chunk(conn, next_id, filename, chunk, vec, bits)
+        next_id = chunk_id + 1
+        print(f"  Embedded chunk {i + 1}/{len(chunks)}")
+    conn.commit()
+    return next_id
+
+def finish_store(conn):
+    if SHARDS:
+        build_shards(conn)
+        print("\nSharded SQLite db built successfully.")
+        return
+
+    print("Building FTS5 lexical index...")
+    lexical.create_index(conn)
+    conn.commit()
+
+    if IVF_NLIST:
+        build_ivf(conn)
+    if HNSW_M:
+        build_hnsw(conn)
+    if QUANTIZATION:
+        build_quantization(conn)
+    if VECTOR_SIDECAR:
+        build_sidecar(conn)
 
     conn.close()
-    print(f"\nSQLite db built successfully.")
+    print("\nSQLite db built successfully.")
 
-    # Upload to S3
-    print(f"Uploading to s3://{S3_BUCKET}/vector_store.db ...")
-    boto3.client("s3").upload_file(DB_PATH, S3_BUCKET, "vector_store.db")
+def publish(sources, next_id):
+    s3 = boto3.client("s3")
+    upload(s3, sources, next_id)
+    if BASELINE:
+        build_baseline(s3)
     print("Done!")
 
+def build():
+    sources = read_sources()
+    if not sources:
+        print("No .txt files found in knowledge_base/")
+        return
+
+    remove_outputs(DB_PATH, VECTORS_PATH)
+    conn = create_store(DB_PATH)
+    next_id = 1
+    for filename, (text, _) in sources.items():
+        next_id = embed_source(conn, filename, text, next_id)
+    finish_store(conn)
+    publish({filename: digest for filename, (_, digest) in sources.items()}, next_id)
+
+def build_delta():
+    """Publish only the knowledge base files that changed since the last
+    build as a delta segment, compacting once COMPACT_AFTER have piled up."""
+    s3 = boto3.client("s3")
+    manifest = fetch_manifest(s3)
+    if manifest is None:
+        print("No manifest to build a delta on; running a full build")
+        return build()
+
+    sources = read_sources()
+    published = manifest['sources']
+    changed = [f for f, (_, digest) in sources.items() if published.get(f) != digest]
+    removed = [f for f in published if f not in sources]
+    if not changed and not removed:
+        print("Knowledge base unchanged; nothing to publish")
+        return
+
+    remove_outputs(DELTA_PATH)
+    conn = create_store(DELTA_PATH)
+    segments.create_tables(conn)
+    # A changed file's earlier chunks die with it, whichever segment holds them
+    segments.write_tombstones(conn, [f for f in changed if f in published] + removed)
+    next_id = manifest['next_id']
+    for filename in changed:
+        next_id = embed_source(conn, filename, sources[filename][0], next_id)
+    lexical.create_index(conn)
+    conn.commit()
+    conn.close()
+    print(f"Delta: {len(changed)} files added or changed, {len(removed)} removed")
+
+    # Segments are immutable; name them by content so a Lambda never
+    # confuses two versions
+    digest = file_sha256(DELTA_PATH)
+    entry = upload_file(s3, DELTA_PATH, f"segments/delta-{digest[:16]}.db{artifact.SUFFIXES[COMPRESSION]}")
+    deltas = manifest['deltas'] + [entry]
+    published = {f: digest for f, digest in published.items() if f not in removed}
+    published.update((f, sources[f][1]) for f in changed)
+    upload_manifest(s3, manifest['files'], deltas, published, next_id, manifest['shards'])
+
+    if len(deltas) >= COMPACT_AFTER:
+        print(f"{len(deltas)} delta segments published; compacting")
+        compact()
+    else:
+        print("Done!")
+
+def compact():
+    """Fold the published delta segments into a new base store, reusing the
+    stored embeddings instead of calling Titan again."""
+    s3 = boto3.client("s3")
+    manifest = fetch_manifest(s3)
+    if manifest is None or not manifest['deltas']:
+        print("No delta segments to compact")
+        return
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        print(f"Downloading base store and {len(manifest['deltas'])} delta segments...")
+        for name, entry in manifest['files'].items():
+            artifact.download(s3, S3_BUCKET, entry, os.path.join(work_dir, name))
+        delta_paths = []
+        for i, entry in enumerate(manifest['deltas']):
+            delta_paths.append(os.path.join(work_dir, f"delta-{i}.db"))
+            artifact.download(s3, S3_BUCKET, entry, delta_paths[-1])
+
+        base_paths = [os.path.join(work_dir, "vector_store.db")]
+        base_conn = sqlite3.connect(base_paths[0])
+        if shards.is_sharded(vector_store.read_meta(base_conn)):
+            # The routing store holds no chunks; they are all in the shards
+            base_paths = []
+            for name, entry in manifest['shards'].items():
+                base_paths.append(os.path.join(work_dir, name))
+                artifact.download(s3, S3_BUCKET, entry, base_paths[-1])
+        base_conn.close()
+        deltas = [segments.Delta.load(path) for path in delta_paths]
+
+        remove_outputs(DB_PATH, VECTORS_PATH)
+        conn = create_store(DB_PATH)
+        base_live = 0
+        for path in base_paths:
+            base_conn = sqlite3.connect(path)
+            base = VectorIndex.load(base_conn, None, use_codes=False, search_mode='exact')
+            if base.dimensions != EMBEDDING_DIMENSIONS:
+                raise SystemExit(f"Published store has {base.dimensions}-dim embeddings, "
+                                 f"EMBEDDING_DIMENSIONS is {EMBEDDING_DIMENSIONS}")
+            live, _ = segments.live_masks(base.sources, deltas)
+            texts = dict(base_conn.execute("SELECT id, chunk_text FROM embeddings").fetchall())
+            bits = read_bits(base_conn)
+            for row in np.flatnonzero(live):
+                chunk_id = int(base.ids[row])
+                insert_chunk(conn, chunk_id, base.sources[row], texts[chunk_id], base.matrix[row], bits.get(chunk_id))
+            base_conn.close()
+            base_live += int(live.sum())
+        _, delta_live = segments.live_masks([], deltas)
+        for delta, live, path in zip(deltas, delta_live, delta_paths):
+            delta_conn = sqlite3.connect(path)
+            bits = read_bits(delta_conn)
+            delta_conn.close()
+            for row in np.flatnonzero(live):
+                chunk_id = int(delta.ids[row])
+                insert_chunk(conn, chunk_id, delta.sources[row], delta.texts[row], delta.matrix[row],
+                             bits.get(chunk_id))
+        conn.commit()
+        print(f"Compacted {base_live} base and "
+              f"{sum(int(live.sum()) for live in delta_live)} delta chunks")
+    finally:
+        shutil.rmtree(work_dir)
+
+    finish_store(conn)
+    publish(manifest['sources'], manifest['next_id'])
+
+def read_bits(conn):
+    """{chunk id: packed bits} from a segment, when BINARY_EMBEDDINGS is on."""
+    if not BINARY_EMBEDDINGS:
+        return {}
+    try:
+        rows = conn.execute("SELECT chunk_id, bits FROM embedding_bits").fetchall()
+    except sqlite3.OperationalError:
+        raise SystemExit("BINARY_EMBEDDINGS=1 but a published segment has no binary embeddings; "
+                         "run a full build")
+    return {chunk_id: np.frombuffer(packed, dtype=np.uint8) for chunk_id, packed in rows}
+
+COMMANDS = {'build': build, 'delta': build_delta, 'compact': compact}
+
 if __name__ == "__main__":
-    build()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build and publish the vector store")
+    parser.add_argument("command", nargs="?", default="build", choices=sorted(COMMANDS),
+                        help="build: embed everything into a new base store; "
+                             "delta: publish only changed files as a delta segment; "
+                             "compact: fold delta segments into a new base store")
+    args = parser.parse_args()
+    if EMBEDDING_DIMENSIONS not in vector_store.TITAN_V2_DIMENSIONS:
+        raise SystemExit(f"EMBEDDING_DIMENSIONS must be one of {vector_store.TITAN_V2_DIMENSIONS}")
+    if COMPRESSION not in artifact.COMPRESSIONS:
+        raise SystemExit(f"COMPRESSION must be one of {artifact.COMPRESSIONS}")
+    if SHARDS and (IVF_NLIST or HNSW_M or QUANTIZATION or VECTOR_SIDECAR):
+        # Shards are small enough to score exactly once loaded
+        raise SystemExit("SHARDS cannot be combined with IVF_NLIST, HNSW_M, QUANTIZATION or VECTOR_SIDECAR")
+    if QUANTIZATION == 'float16' and VECTOR_SIDECAR:
+        # The float16 codes are the only vectors such a store keeps
+        raise SystemExit("VECTOR_SIDECAR has nothing to hold with QUANTIZATION=float16")
+    COMMANDS[args.command]()
@@ -0,0 +1,73 @@
+"""
+Create the DynamoDB tables a Chalice stage's shared cache and sessions use.
+
+Reads CACHE_BACKEND / CACHE_TABLE and SESSION_BACKEND / SESSION_TABLE from
+the stage in bedrock-chat-app/.chalice/config.json, and for each table a
+dynamodb backend names, creates it if it is missing and turns on TTL over
+expires_at. Safe to re-run; run it before every `chalice deploy`:
+
+    python scripts/create_cache_table.py
+    python scripts/create_cache_table.py --stage prod
+"""
+
+import argparse
+import json
+import os
+
+import boto3
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bedrock-chat-app", ".chalice",
+                           "config.json")
+
+
+def stage_tables(stage):
+    with open(CONFIG_PATH) as f:
+        env = json.load(f)['stages'][stage]['environment_variables']
+    tables = []
+    for backend, table in (('CACHE_BACKEND', 'CACHE_TABLE'), ('SESSION_BACKEND', 'SESSION_TABLE')):
+        if env.get(backend) == 'dynamodb' and env[table] not in tables:
+            tables.append(env[table])
+    return tables
+
+
+def ensure_table(client, table_name):
+    try:
+        client.describe_table(TableName=table_name)
+        print(f"{table_name}: exists")
+    except client.exceptions.ResourceNotFoundException:
+        client.create_table(
+            TableName=table_name,
+            AttributeDefinitions=[{'AttributeName': 'cache_key', 'AttributeType': 'S'}],
+            KeySchema=[{'AttributeName': 'cache_key', 'KeyType': 'HASH'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        client.get_waiter('table_exists').wait(TableName=table_name)
+        print(f"{table_name}: created")
+
+    ttl = client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+    if ttl.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        print(f"{table_name}: TTL on {ttl.get('AttributeName')}")
+        return
+    client.update_time_to_live(
+        TableName=table_name,
+        TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'},
+    )
+    print(f"{table_name}: enabled TTL on expires_at")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stage", default="dev", help="Chalice stage whose config names the tables")
+    args = parser.parse_args()
+
+    tables = stage_tables(args.stage)
+    if not tables:
+        print(f"Stage {args.stage} uses no DynamoDB backend")
+        return
+    client = boto3.client("dynamodb", region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+    for table_name in tables:
+        ensure_table(client, table_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Drive the WebSocket chat handlers locally, without API Gateway or AWS.
+
+The handlers in app.py are invoked with synthetic WebSocket events and their
+replies are printed as the API Gateway management API would deliver them.
+The store is a local vector_store.db served as the bundled baseline, and
+Titan and the chat model are replaced by stand-ins (the model streams back
+the retrieved context) unless --bedrock is given:
+
+    python scripts/ws_chat_local.py "What projects has Eliot built?"
+    python scripts/ws_chat_local.py "What projects has Eliot built?" --cancel-after 5
+    python scripts/ws_chat_local.py "What projects has Eliot built?" --disconnect-after 5
+    python scripts/ws_chat_local.py "What projects has Eliot built?" --bedrock
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bedrock-chat-app")
+CONNECTION_ID = "local-connection"
+
+
+class GoneException(Exception):
+    pass
+
+
+class ManagementApi:
+    """Stands in for the apigatewaymanagementapi client the handlers send with."""
+
+    class exceptions:
+        GoneException = GoneException
+
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.gone = False
+        self.start = time.perf_counter()
+
+    def post_to_connection(self, ConnectionId, Data):
+        if self.gone:
+            raise GoneException(ConnectionId)
+        print(f"[{time.perf_counter() - self.start:7.3f}s] <- {Data}")
+        if json.loads(Data).get('type') == 'text':
+            self.on_text()
+
+
+class Session:
+    region_name = "us-east-1"
+
+    def __init__(self, api):
+        self.api = api
+
+    def client(self, service_name, endpoint_url=None):
+        return self.api
+
+
+class StandInS3:
+    """Every store check finds the baseline current."""
+
+    def get_object(self, **kwargs):
+        from botocore.exceptions import ClientError
+        raise ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+
+
+class StandInBedrock:
+    """Deterministic query embeddings, and a model that streams its prompt's
+    context back word by word."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def invoke_model(self, modelId, body):
+        request = json.loads(body)
+        seed = int(hashlib.sha256(request['inputText'].encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(request['dimensions'])
+        vector /= np.linalg.norm(vector)
+        result = {'embedding': vector.tolist()}
+        if 'embeddingTypes' in request:
+            result['embeddingsByType'] = {'float': vector.tolist(), 'binary': (vector > 0).astype(int).tolist()}
+        return {'body': io.BytesIO(json.dumps(result).encode("utf-8"))}
+
+    def converse_stream(self, messages, **kwargs):
+        words = messages[-1]['content'][0]['text'].split()[:60]
+        return {'stream': StandInStream(words, self.delay)}
+
+
+class StandInStream:
+    def __init__(self, words, delay):
+        self.words = words
+        self.delay = delay
+        self.closed = False
+
+    def __iter__(self):
+        yield {'messageStart': {'role': 'assistant'}}
+        # Reasoning models think before answering; these deltas are not relayed
+        for _ in range(3):
+            if self.closed:
+                return
+            time.sleep(self.delay)
+            yield {'contentBlockDelta': {'delta': {'reasoningContent': {'text': "..."}}, 'contentBlockIndex': 0}}
+        for word in self.words:
+            if self.closed:
+                return
+            time.sleep(self.delay)
+            yield {'contentBlockDelta': {'delta': {'text': word + " "}, 'contentBlockIndex': 0}}
+        yield {'messageStop': {'stopReason': 'end_turn'}}
+        yield {'metadata': {'usage': {'inputTokens': 0, 'outputTokens': len(self.words)},
+                            'metrics': {'latencyMs': int(self.delay * 1000 * len(self.words))}}}
+
+    def close(self):
+        self.closed = True
+        print("   (model stream closed)")
+
+
+def ws_event(route_key, body=None):
+    return {
+        'requestContext': {
+            'routeKey': route_key,
+            'connectionId': CONNECTION_ID,
+            'apiId': "local",
+            'stage': "local",
+            'domainName': "localhost",
+        },
+        'body': body,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("message")
+    parser.add_argument("--db", default="vector_store.db", help="vector store to serve")
+    parser.add_argument("--bedrock", action="store_true",
+                        help="call Titan and the chat model for real (needs AWS credentials)")
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds between stand-in model deltas")
+    parser.add_argument("--cancel-after", type=int, default=0, help="send a cancel message after N deltas")
+    parser.add_argument("--disconnect-after", type=int, default=0, help="drop the connection after N deltas")
+    args = parser.parse_args()
+
+    baseline_dir = tempfile.mkdtemp()
+    shutil.copyfile(args.db, os.path.join(baseline_dir, "vector_store.db"))
+    with open(os.path.join(baseline_dir, "VERSION"), "w") as f:
+        f.write("local")
+    os.environ['BASELINE_DIR'] = baseline_dir
+    # In-process, so a cancel sent from another thread reaches the stream
+    os.environ['CACHE_BACKEND'] = "memory"
+    os.environ['SESSION_BACKEND'] = "memory"
+    os.environ.setdefault('AWS_REGION', "us-east-1")
+
+    import boto3
+    real_client = boto3.client
+    bedrock = StandInBedrock(args.delay)
+
+    def client(service_name=None, **kwargs):
+        if service_name == "s3":
+            return StandInS3()
+        return real_client(service_name, **kwargs) if args.bedrock else bedrock
+    boto3.client = client
+
+    sys.path.insert(0, APP_DIR)
+    import app as chat_app
+
+    texts = 0
+
+    def on_text():
+        nonlocal texts
+        texts += 1
+        if texts == args.cancel_after:
+            threading.Thread(target=send, args=({'action': 'cancel', 'id': "1"},)).start()
+        if texts == args.disconnect_after:
+            api.gone = True
+            print("   (client disconnected)")
+            chat_app.ws_disconnect(ws_event("$disconnect"), None)
+
+    def send(body):
+        print(f"-> {json.dumps(body)}")
+        chat_app.ws_message(ws_event("$default", json.dumps(body)), None)
+
+    # Nothing a previous run or a real deployment left in /tmp is served
+    chat_app.STATE_PATH = os.path.join(baseline_dir, "vector_store_state.json")
+    chat_app.STORES_DIR = os.path.join(baseline_dir, "stores")
+    chat_app.SEGMENTS_DIR = os.path.join(baseline_dir, "segments")
+
+    api = ManagementApi(on_text)
+    chat_app.app.websocket_api.session = Session(api)
+    # Cancellation is polled between deltas; check on every one here
+    chat_app.WS_CANCEL_CHECK_INTERVAL = 0
+    try:
+        chat_app.ws_connect(ws_event("$connect"), None)
+        send({'action': 'chat', 'id': "1", 'message': args.message})
+        if not api.gone:
+            chat_app.ws_disconnect(ws_event("$disconnect"), None)
+    finally:
+        shutil.rmtree(baseline_dir)
+
+
+if __name__ == "__main__":
+    main()